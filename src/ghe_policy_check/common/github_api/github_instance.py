@@ -1,18 +1,31 @@
 # Copyright (c) 2022, Qualcomm Innovation Center, Inc. All rights reserved.
 # SPDX-License-Identifier: BSD-3-Clause
 
-# pylint: disable=too-many-public-methods
+# pylint: disable=too-many-public-methods,too-many-lines
 # Bug in pylint https://github.com/PyCQA/pylint/issues/3882
 import logging
-from contextlib import contextmanager
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from time import sleep, time
-from typing import Any, Dict, Generator, List, Optional
+from functools import lru_cache
+from random import uniform
+from threading import Lock
+from time import monotonic, sleep, time
+from typing import Any, Callable, Dict, Generator, List, Optional, Type, cast
+from urllib.parse import parse_qs, urlencode, urlsplit, urlunsplit
 
 from django.conf import settings
-from requests import HTTPError, Response, delete, get, post, put
+from requests import HTTPError, Response, Session
+from requests.adapters import HTTPAdapter
 from requests.status_codes import codes
-from requests.utils import parse_header_links
+from urllib3.util.retry import Retry
+
+try:
+    from orjson import loads as json_loads
+except ImportError:  # pragma: no cover
+    from json import loads as json_loads  # type: ignore
 
 from ghe_policy_check.common.github_api.types import (
     GitHubObject,
@@ -25,6 +38,13 @@ from ghe_policy_check.common.github_api.types import (
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=None)
+def _url_template(base_url: str, endpoint: str) -> str:
+    # Endpoints are written with str.format placeholders, they are converted
+    # once to a %-format template that already includes the base url
+    return base_url + endpoint.replace("%", "%%").replace("{}", "%s")
+
+
 class GithubException(Exception):
     pass
 
@@ -57,8 +77,96 @@ class InvalidImpersonationError(Exception):
     pass
 
 
-class GitHubInstance:
+_STATUS_CODE_EXCEPTIONS: Dict[int, Type[GithubException]] = {
+    codes.unprocessable_entity: GithubClientException,
+    codes.not_found: GithubNotFoundException,
+}
+
+_MESSAGE_EXCEPTIONS: Dict[str, Type[GithubException]] = {
+    "Sorry. Your account was suspended.": GithubAccountSuspendedException,
+    "Repository access blocked": GithubRepositoryBlockedException,
+    "Bad credentials": GithubBadCredentialsException,
+}
+
+
+@dataclass
+class TokenBucket:
+    """
+    Paces the requests made with a single GitHub token so that its remaining
+    rate limit is spread evenly over the time left until the rate limit resets
+    """
+
+    capacity: float
+    refill_rate: float
+    tokens: float = field(init=False)
+    remaining: Optional[int] = field(init=False, default=None)
+    reset: float = field(init=False, default=0)
+    last_refill: float = field(init=False, default_factory=monotonic)
+    _lock: Lock = field(init=False, default_factory=Lock, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self.tokens = self.capacity
+
+    def _refill(self) -> None:
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.refill_rate)
+        self.last_refill = now
+
+    def acquire(self) -> None:
+        """
+        Takes a token from the bucket, sleeping just long enough to earn one
+        if the bucket is empty
+        """
+        with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                sleep((1 - self.tokens) / self.refill_rate)
+                self._refill()
+            self.tokens -= 1
+
+    def update(self, remaining: int, reset: int) -> None:
+        """
+        Reseeds the bucket from the rate limit GitHub reported for the token
+
+        :param remaining: The number of requests remaining in the current window
+        :param reset: The epoch time at which the rate limit window resets
+        """
+        with self._lock:
+            self._refill()
+            self.refill_rate = max(remaining, 1) / max(1, reset - time())
+            self.tokens = min(self.tokens, remaining)
+            self.remaining = remaining
+            self.reset = reset
+
+    def is_depleted(self, threshold: int) -> bool:
+        """
+        Checks whether GitHub last reported fewer than ``threshold`` requests
+        remaining for the token before its rate limit resets
+
+        :param threshold: The minimum number of remaining requests
+        :return: True if the token should not be used until its rate limit resets
+        """
+        return self.remaining is not None and self.remaining < threshold and self.reset > time()
+
+
+# A token's rate limit is shared by every instance using it, ie the per thread
+# instances of the polling workers, so its bucket is shared by them as well
+_RATE_LIMITS: Dict[str, TokenBucket] = {}
+_RATE_LIMITS_LOCK = Lock()
+
+
+class GitHubInstance:  # pylint: disable=too-many-instance-attributes
     ALL_SCOPES = ["repo", "admin:org", "user", "site_admin"]
+    POOL_CONNECTIONS = 4
+    POOL_MAXSIZE = 32
+    RATE_LIMIT_BURST = 100
+    RATE_LIMIT_MIN_REMAINING = 5
+    RETRY_BACKOFF_BASE = 1.0
+    RETRY_BACKOFF_CAP = 60.0
+    ETAG_CACHE_SIZE = 256
+    PAGINATION_WORKERS = 8
+    GRAPHQL_BATCH_SIZE = 100
+    GRAPHQL_USER_FIELDS = "login databaseId name email isSiteAdmin suspendedAt"
 
     class Endpoints:  # pylint: disable=too-few-public-methods
         AUTHENTICATED_USER_REPOS = "/user/repos"
@@ -84,6 +192,20 @@ class GitHubInstance:
         USER_BY_NAME = "/users/{}"
         USER_REPOS = "/users/{}/repos"
 
+    @staticmethod
+    def _get_link_url(response: Response, rel: str) -> Optional[str]:
+        # Scans for the rel directly instead of parsing every link in the
+        # header, the last page of a walk has no next link at all
+        link = response.headers.get("Link")
+        if not link:
+            return None
+        rel_index = link.find(f'rel="{rel}"')
+        if rel_index == -1:
+            return None
+        url_start = link.rfind("<", 0, rel_index) + 1
+        url_end = link.index(">", url_start)
+        return link[url_start:url_end]
+
     @staticmethod
     def get_next_url(response: Response) -> Optional[str]:
         """
@@ -92,17 +214,31 @@ class GitHubInstance:
         :param response: The response to get the next page url for
         :return: The next url if it found
         """
-        headers = response.headers
-        if "Link" not in headers:
+        return GitHubInstance._get_link_url(response, "next")
+
+    @staticmethod
+    def get_remaining_page_urls(response: Response) -> Optional[List[str]]:
+        """
+        Gets the urls of every page after the first from the last url in the
+        Link headers. Only endpoints paginated by page number provide a last url
+
+        :param response: The response of the first page
+        :return: The urls of the remaining pages if the endpoint is paginated by page number
+        """
+        last_url = GitHubInstance._get_link_url(response, "last")
+        if not last_url:
+            return None
+
+        split_url = urlsplit(last_url)
+        query = parse_qs(split_url.query)
+        if "page" not in query:
             return None
 
-        parsed_link_headers: List[Dict[str, str]] = parse_header_links(
-            headers["Link"]
-        )  # type: ignore
-        for link_header in parsed_link_headers:
-            if link_header["rel"] == "next":
-                return link_header["url"]
-        return None
+        page_urls = []
+        for page in range(2, int(query["page"][0]) + 1):
+            query["page"] = [str(page)]
+            page_urls.append(urlunsplit(split_url._replace(query=urlencode(query, doseq=True))))
+        return page_urls
 
     def __init__(
         self,
@@ -110,6 +246,7 @@ class GitHubInstance:
         url: str = settings.GITHUB_API_URL,
         headers: Optional[Dict[str, str]] = None,
         impersonating: Optional[str] = None,
+        session: Optional[Session] = None,
     ):
         """
         Creates a GitHub instance, setting default preview headers if no
@@ -120,11 +257,53 @@ class GitHubInstance:
         :param headers: Optional headers to specify for every request
         :param impersonating: An optional user to indicate the user
         that this instance is impersonating
+        :param session: An optional session, owned by another instance, to send
+        requests with. The session keeps the headers it was configured with
         """
         if not tokens:
             raise ValueError("At least one github token must be provided")
         self.base_url = url
-        self.headers = (
+
+        # A single session keeps connections to the GitHub instance alive
+        # between requests instead of opening a new connection for each call
+        self._owns_session = session is None
+        self._session = session if session is not None else self._create_session(headers)
+        self.headers = self._session.headers
+        self.tokens = tokens
+        # The tokens are rotated by every request, and the instance may be
+        # shared by the threads fetching the pages of a paginated listing
+        self._tokens_lock = Lock()
+        self.impersonating = impersonating
+        self._token_headers: Dict[str, Dict[str, str]] = {}
+        # Set by impersonate_user to unsuspend the impersonated user the first
+        # time a request fails because they are suspended
+        self._on_account_suspended: Optional[Callable[[], None]] = None
+        # Set by impersonate_user to replace the impersonation token, cached by
+        # the impersonating instance, when it has been revoked or deleted
+        self._on_bad_credentials: Optional[Callable[[], str]] = None
+        self._impersonation_tokens: Dict[str, str] = {}
+        self._backoff = GitHubInstance.RETRY_BACKOFF_BASE
+        self._etag_cache: "OrderedDict[str, Response]" = OrderedDict()
+
+    @staticmethod
+    def _create_session(headers: Optional[Dict[str, str]]) -> Session:
+        session = Session()
+        # Transient server errors are retried by the connection pool with an
+        # exponential backoff before the response is returned
+        adapter = HTTPAdapter(
+            pool_connections=GitHubInstance.POOL_CONNECTIONS,
+            pool_maxsize=GitHubInstance.POOL_MAXSIZE,
+            max_retries=Retry(
+                total=5,
+                backoff_factor=1.0,
+                status_forcelist=[500, 502, 503, 504],
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            ),
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update(
             headers
             if headers
             else {
@@ -132,9 +311,25 @@ class GitHubInstance:
                 "application/vnd.github.mercy-preview+json"
             }
         )
-        self.tokens = tokens
-        self.headers["Authorization"] = f"Bearer {self.tokens[0]}"
-        self.impersonating = impersonating
+        return session
+
+    def close(self) -> None:
+        """
+        Closes the underlying session and any connections it is holding open,
+        unless the session is shared with the instance that owns it
+        """
+        if self._owns_session:
+            self._session.close()
+
+    def _url(self, endpoint: str, *args: Any) -> str:
+        """
+        Builds the full url of an endpoint on the GitHub instance
+
+        :param endpoint: One of the :class:`Endpoints`
+        :param args: The values to fill the endpoint placeholders with
+        :return: The url of the endpoint
+        """
+        return _url_template(self.base_url, endpoint) % args
 
     def rotate_token(self) -> None:
         """
@@ -142,9 +337,27 @@ class GitHubInstance:
         has hit its rate limit
         """
         logger.info("Rotating Github API Token")
-        old_token = self.tokens.pop(0)
-        self.tokens.append(old_token)
-        self.headers["Authorization"] = f"Bearer {self.tokens[0]}"
+        with self._tokens_lock:
+            old_token = self.tokens.pop(0)
+            self.tokens.append(old_token)
+
+    def _next_token(self) -> str:
+        # Requests are spread across every token round robin, skipping tokens
+        # that are nearly out of requests until their rate limit resets
+        with self._tokens_lock:
+            for _ in range(len(self.tokens)):
+                token = self.tokens[0]
+                self.tokens.append(self.tokens.pop(0))
+                bucket = _RATE_LIMITS.get(token)
+                if not bucket or not bucket.is_depleted(GitHubInstance.RATE_LIMIT_MIN_REMAINING):
+                    return token
+            # Every token is depleted, the next one in round robin order is
+            # used anyway and its bucket paces it until its rate limit resets
+            return self.tokens[0]
+
+    def _replace_tokens(self, tokens: List[str]) -> None:
+        with self._tokens_lock:
+            self.tokens = tokens
 
     def get_rate_limit_reset(self) -> int:
         """
@@ -152,59 +365,132 @@ class GitHubInstance:
 
         :return: The epoch time at which the rate limit will reset
         """
-        response = self.get(self.base_url + GitHubInstance.Endpoints.RATE_LIMIT)
+        response = self.get(self._url(GitHubInstance.Endpoints.RATE_LIMIT))
         reset_time: int = response.json()["resources"]["core"]["reset"]
         return reset_time
 
-    def _handle_rate_limit_exception(self, verb: Any, url: str, retry: int) -> Response:
-        # len - 1 to prevent rotating to token that just expired
+    def _auth_headers(self, token: str) -> Dict[str, str]:
+        # The Authorization header of each token is built once and reused
+        headers = self._token_headers.get(token)
+        if headers is None:
+            headers = self._token_headers[token] = {"Authorization": f"Bearer {token}"}
+        return headers
+
+    @staticmethod
+    def _pace_request(token: str) -> None:
+        bucket = _RATE_LIMITS.get(token)
+        if bucket:
+            bucket.acquire()
+
+    @staticmethod
+    def _update_rate_limit(token: str, response: Response) -> None:
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        # GitHub instances with rate limiting disabled don't send the headers
+        if remaining is None or reset is None:
+            return
+        # The buckets pace the REST api, other resources such as GraphQL
+        # have their own budget that would throw off the pacing
+        if response.headers.get("X-RateLimit-Resource", "core") != "core":
+            return
+
+        bucket = _RATE_LIMITS.get(token)
+        if not bucket:
+            with _RATE_LIMITS_LOCK:
+                bucket = _RATE_LIMITS.setdefault(
+                    token, TokenBucket(GitHubInstance.RATE_LIMIT_BURST, 0)
+                )
+        bucket.update(int(remaining), int(reset))
+
+    def _next_backoff(self) -> float:
+        # Decorrelated jitter keeps workers that were rate limited at the same
+        # time from all retrying at the same time
+        self._backoff = min(
+            GitHubInstance.RETRY_BACKOFF_CAP,
+            uniform(GitHubInstance.RETRY_BACKOFF_BASE, self._backoff * 3),
+        )
+        return self._backoff
+
+    def _handle_rate_limit_exception(self, retry: int, response: Response) -> None:
+        # Waits, if needed, so the rate limited request can be retried. Every
+        # retry is already sent with the next token in round robin order
+        # Secondary rate limits state exactly how long to wait before retrying
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry <= 2 * len(self.tokens):
+            logger.info("Rate limit reached, retrying in %s seconds", retry_after)
+            sleep(int(retry_after))
+            return
+
+        # len - 1 so the other tokens are tried before waiting
         if retry < len(self.tokens) - 1:
-            self.rotate_token()
-            return self.request(verb, url, retry + 1)
+            return
 
         if retry > 2 * len(self.tokens):
             raise Exception("Rate limit retries failed")
-        reset_time = self.get_rate_limit_reset()
+        # The reset of the token that was rate limited is sent with its response
+        reset_time = int(response.headers.get("X-RateLimit-Reset", time()))
         retry_time = datetime.fromtimestamp(reset_time, timezone.utc)
         logger.info("Rate limit reached, retrying at %s", retry_time)
 
-        try:
-            sleep((reset_time - time() + 5))
-        except ValueError:
-            pass
-        else:
+        wait = reset_time - time()
+        if wait > 0:
             logger.warning("All Github tokens rate limited")
-        return self.request(verb, url, retry + 1)
+        sleep(max(wait, 0) + self._next_backoff())
 
-    def request(self, verb: Any, url: str, retry: int = 0, **kwargs: Any) -> Response:
+    def request(self, verb: str, url: str, retry: int = 0, **kwargs: Any) -> Response:
         """
         Make a HTTP request with the given HTTP verb, raising any non 2XX
-        status codes as errors. Handles :class:`RateLimitException` by waiting
-        on retrying the request and :class:`BadCredentialsExceptions` by
+        status codes as errors. Each request is made with the next token in
+        round robin order and paced to spread the remaining rate limit of that
+        token until it resets. Handles :class:`RateLimitException`
+        by waiting on retrying the request and :class:`BadCredentialsExceptions` by
         regenerating an impersonation token
 
-        :param verb: The HTTP verb that will be requested
+        :param verb: The HTTP verb that will be requested, ie "GET"
         :param url:  The url to make the request to
-        :param retry: A retry count to prevent infinite retry loops
+        :param retry: The number of retries already made for the request, only
+            used for logging
         :param kwargs: kwargs to be passed to the HTTP Request
         :return: :class:`Response` from the given HTTP Request
         """
-        logger.debug("Request type %s to url %s. Retry count: %s", verb.__name__, url, retry)
-        response: Response = verb(url, headers=self.headers, **kwargs)
-        try:
-            GitHubInstance.handle_error(response)
-        except RateLimitException:
-            return self._handle_rate_limit_exception(verb, url, retry)
-        except GithubBadCredentialsException:
-            if not self.impersonating or retry:
-                raise
-            # Attempt to fix bad credentials with new user token
-            token = self.get_impersonation_token(self.impersonating)
-            self.tokens = [token]
-            self.headers["Authorization"] = f"Bearer {self.tokens[0]}"
-            return self.request(verb, url, 1)
-
-        return response
+        extra_headers = kwargs.pop("headers", {})
+        # Each kind of failure is recovered from independently, a rate limit
+        # or an unsuspended user doesn't use up the credentials refresh
+        rate_limit_attempt = 0
+        refreshed_credentials = False
+        while True:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Request type %s to url %s. Retry count: %s", verb, url, retry)
+            token = self._next_token()
+            headers = self._auth_headers(token)
+            if extra_headers:
+                headers = {**headers, **extra_headers}
+            self._pace_request(token)
+            response: Response = self._session.request(verb, url, headers=headers, **kwargs)
+            self._update_rate_limit(token, response)
+            try:
+                GitHubInstance.handle_error(response)
+            except RateLimitException:
+                self._handle_rate_limit_exception(rate_limit_attempt, response)
+                rate_limit_attempt += 1
+            except GithubBadCredentialsException:
+                on_bad_credentials = self._on_bad_credentials
+                if not on_bad_credentials or refreshed_credentials:
+                    raise
+                # Attempt to fix bad credentials with new user token
+                refreshed_credentials = True
+                self._replace_tokens([on_bad_credentials()])
+            except GithubAccountSuspendedException:
+                on_account_suspended = self._on_account_suspended
+                if not on_account_suspended:
+                    raise
+                self._on_account_suspended = None
+                on_account_suspended()
+            else:
+                # Later rate limits start backing off from the base again
+                self._backoff = GitHubInstance.RETRY_BACKOFF_BASE
+                return response
+            retry += 1
 
     @staticmethod
     def raise_error(error: HTTPError) -> None:
@@ -217,17 +503,12 @@ class GitHubInstance:
         response = error.response
         message = response.json().get("message")
 
-        if response.status_code == codes.unprocessable_entity:
-            raise GithubClientException(message)
-        if response.status_code == codes.not_found:
-            raise GithubNotFoundException(message)
-        if message == "Sorry. Your account was suspended.":
-            raise GithubAccountSuspendedException(message)
-        if message == "Repository access blocked":
-            raise GithubRepositoryBlockedException(message)
-        if message == "Bad credentials":
-            raise GithubBadCredentialsException(message)
-        if "rate limit" in message:
+        exception = _STATUS_CODE_EXCEPTIONS.get(response.status_code)
+        if not exception:
+            exception = _MESSAGE_EXCEPTIONS.get(message)
+        if exception:
+            raise exception(message)
+        if message and "rate limit" in message:
             raise RateLimitException(message)
 
         raise error
@@ -240,6 +521,8 @@ class GitHubInstance:
 
         :param response: The response to check error messages on
         """
+        if response.status_code < 400:
+            return
         try:
             response.raise_for_status()
         except HTTPError as e:
@@ -252,7 +535,7 @@ class GitHubInstance:
         :param url: The url to make the DELETE call at
         :return: A response object from the DELETE call
         """
-        return self.request(delete, url, **kwargs)
+        return self.request("DELETE", url, **kwargs)
 
     def put(self, url: str, **kwargs: Any) -> Response:
         """
@@ -261,7 +544,7 @@ class GitHubInstance:
         :param url: The url to make the PUT call at
         :return: A response object from the PUT call
         """
-        return self.request(put, url, **kwargs)
+        return self.request("PUT", url, **kwargs)
 
     def post(self, url: str, **kwargs: Any) -> Response:
         """
@@ -270,36 +553,112 @@ class GitHubInstance:
         :param url: The url to make the POST call at
         :return: A response object from the POST call
         """
-        return self.request(post, url, **kwargs)
+        return self.request("POST", url, **kwargs)
+
+    def _cache_response(self, url: str, response: Response) -> None:
+        headers = response.headers
+        # Only single resources are cached, the pages of a paginated listing
+        # carry a Link header and would fill the cache with large bodies
+        if (
+            "Link" in headers
+            or "no-store" in headers.get("Cache-Control", "")
+            or not ("ETag" in headers or "Last-Modified" in headers)
+        ):
+            self._etag_cache.pop(url, None)
+            return
+
+        self._etag_cache[url] = response
+        self._etag_cache.move_to_end(url)
+        if len(self._etag_cache) > GitHubInstance.ETAG_CACHE_SIZE:
+            self._etag_cache.popitem(last=False)
 
     def get(self, url: str) -> Response:
         """
-        Utility wrapper for a GET call utilizing the underlying :func:`request`
+        Utility wrapper for a GET call utilizing the underlying :func:`request`.
+        Single resource responses are cached by their ETag or Last-Modified
+        headers so that repeated calls are made as conditional requests,
+        returning the cached response if GitHub reports it has not been modified.
+        Pages of paginated listings are not cached
 
         :param url: The url to make the GET call at
         :return: A response object from the GET call
         """
-        return self.request(get, url)
+        cached = self._etag_cache.get(url)
+        if not cached:
+            response = self.request("GET", url)
+        else:
+            conditional_headers: Dict[str, str] = {}
+            if "ETag" in cached.headers:
+                conditional_headers["If-None-Match"] = cached.headers["ETag"]
+            if "Last-Modified" in cached.headers:
+                conditional_headers["If-Modified-Since"] = cached.headers["Last-Modified"]
+
+            response = self.request("GET", url, headers=conditional_headers)
+            if response.status_code == codes.not_modified:
+                self._etag_cache.move_to_end(url)
+                return cached
+
+        self._cache_response(url, response)
+        return response
+
+    @staticmethod
+    def _drain(items: List[Any]) -> Generator[Any, None, None]:
+        # Pops each item as it is yielded so a slow consumer doesn't keep the
+        # items it has already processed alive for the rest of the page
+        items.reverse()
+        while items:
+            yield items.pop()
 
     def get_paginated_response(self, url: str) -> Generator[GitHubObject, None, None]:
         """
         Gets all the results for a REST query that has it results paginated
-        across one or more pages
+        across one or more pages. The pages are not cached by :func:`get`
 
         :param url: The url to get the paginated results from
         :return: A generator that will generate responses as it is called
         """
         next_url: Optional[str] = url + "&per_page=100" if "?" in url else url + "?per_page=100"
         while next_url:
-            response = self.get(next_url)
+            response = self.request("GET", next_url)
             try:
                 response.raise_for_status()
             except HTTPError as e:
                 logger.exception(e)
 
-            for item in response.json():
-                yield item
+            items = json_loads(response.content)
+            next_url = self.get_next_url(response)
+            # Pages are fetched around the ETag cache, so nothing else holds the
+            # raw page once it is released before handing out its items
+            del response
+            yield from self._drain(items)
+
+    def get_paginated_response_concurrent(self, url: str) -> Generator[GitHubObject, None, None]:
+        """
+        Gets all the results for a REST query that has it results paginated
+        across one or more pages. If the first page provides the number of the
+        last page the remaining pages are fetched concurrently, otherwise the
+        next urls are followed like :func:`get_paginated_response`
+
+        :param url: The url to get the paginated results from
+        :return: A generator that will generate responses as it is called
+        """
+        first_url = url + "&per_page=100" if "?" in url else url + "?per_page=100"
+        response = self.request("GET", first_url)
+        page_urls = self.get_remaining_page_urls(response)
+        yield from json_loads(response.content)
+
+        if page_urls is None:
             next_url = self.get_next_url(response)
+            while next_url:
+                response = self.request("GET", next_url)
+                yield from json_loads(response.content)
+                next_url = self.get_next_url(response)
+            return
+
+        with ThreadPoolExecutor(max_workers=GitHubInstance.PAGINATION_WORKERS) as executor:
+            # map returns the pages in order as they complete
+            for page in executor.map(lambda page_url: self.request("GET", page_url), page_urls):
+                yield from json_loads(page.content)
 
     def get_paginated_search_response(self, url: str) -> Generator[Dict[str, Any], None, None]:
         """
@@ -311,24 +670,25 @@ class GitHubInstance:
         """
         next_url: Optional[str] = url + "&per_page=100" if "?" in url else url + "?per_page=100"
         while next_url:
-            response = self.get(next_url)
+            response = self.request("GET", next_url)
             try:
                 response.raise_for_status()
             except HTTPError as e:
                 logger.exception(e)
 
-            for item in response.json()["items"]:
-                yield item
+            items = json_loads(response.content)["items"]
             next_url = self.get_next_url(response)
+            del response
+            yield from self._drain(items)
 
     def get_organizations(self, since: Optional[int] = None) -> Generator[GitHubOrg, None, None]:
-        url = self.base_url + GitHubInstance.Endpoints.ORGANIZATIONS
+        url = self._url(GitHubInstance.Endpoints.ORGANIZATIONS)
         if since:
             url += f"?since={since}"
         return self.get_paginated_response(url)  # type:  ignore
 
     def get_users(self, since: Optional[int] = None) -> Generator[GitHubUser, None, None]:
-        url = self.base_url + GitHubInstance.Endpoints.USERS
+        url = self._url(GitHubInstance.Endpoints.USERS)
         if since:
             url += f"?since={since}"
         return self.get_paginated_response(url)  # type:  ignore
@@ -336,43 +696,47 @@ class GitHubInstance:
     def get_authenticated_user_repos(self, parameters: str = "") -> List[GitHubRepo]:
         return list(
             self.get_paginated_response(  # type:  ignore
-                self.base_url + GitHubInstance.Endpoints.AUTHENTICATED_USER_REPOS + parameters
+                self._url(GitHubInstance.Endpoints.AUTHENTICATED_USER_REPOS) + parameters
             )
         )
 
     def get_user_public_repos(self, user: str) -> Generator[GitHubRepo, None, None]:
-        return self.get_paginated_response(  # type:  ignore
-            self.base_url + GitHubInstance.Endpoints.USER_REPOS.format(user)
+        return self.get_paginated_response_concurrent(  # type:  ignore
+            self._url(GitHubInstance.Endpoints.USER_REPOS, user)
         )
 
     def get_organization_repos(
         self, organization: str, paramaters: str = ""
     ) -> Generator[GitHubRepo, None, None]:
-        return self.get_paginated_response(  # type:  ignore
-            self.base_url
-            + GitHubInstance.Endpoints.ORGANIZATION_REPOS.format(organization)
-            + paramaters
+        return self.get_paginated_response_concurrent(  # type:  ignore
+            self._url(GitHubInstance.Endpoints.ORGANIZATION_REPOS, organization) + paramaters
         )
 
     def create_org_repo(self, org_name: str, data: Any) -> Response:
         return self.post(
-            self.base_url + GitHubInstance.Endpoints.ORGANIZATION_REPOS.format(org_name), json=data
+            self._url(GitHubInstance.Endpoints.ORGANIZATION_REPOS, org_name), json=data
         )
 
     def get_repository_topics(self, owner: str, repo: str) -> Any:
-        resp = self.get(self.base_url + GitHubInstance.Endpoints.REPO_TOPICS.format(owner, repo))
+        resp = self.get(self._url(GitHubInstance.Endpoints.REPO_TOPICS, owner, repo))
         return resp.json()
 
     def set_repository_topics(self, owner: str, repo: str, topics: List[str]) -> Response:
         return self.put(
-            self.base_url + GitHubInstance.Endpoints.REPO_TOPICS.format(owner, repo),
+            self._url(GitHubInstance.Endpoints.REPO_TOPICS, owner, repo),
             json={"names": topics},
         )
 
     def get_repository_forks(self, owner: str, repo: str) -> Response:
-        return self.get(self.base_url + GitHubInstance.Endpoints.REPO_FORKS.format(owner, repo))
+        return self.get(self._url(GitHubInstance.Endpoints.REPO_FORKS, owner, repo))
 
-    def add_repository_topics(self, owner: str, repo: str, new_topics: List[str]) -> Any:
+    def add_repository_topics(
+        self,
+        owner: str,
+        repo: str,
+        new_topics: List[str],
+        existing_topics: Optional[List[str]] = None,
+    ) -> Any:
         """
         Adds a repository topic by getting the existing topics, adding the new
         topic, then setting the topics to the new set list of topics
@@ -380,59 +744,138 @@ class GitHubInstance:
         :param owner: The owner of the repository
         :param repo: The name of the repository
         :param new_topics: The topic to add to the given repository
+        :param existing_topics: The current topics of the repository if they are
+            already known, ie from the ``topics`` of a repository response,
+            which skips getting them from GitHub
         :return: The response from GitHub from setting the topics
         """
-        topics = self.get_repository_topics(owner, repo)["names"]
+        topics = (
+            existing_topics
+            if existing_topics is not None
+            else self.get_repository_topics(owner, repo)["names"]
+        )
         return self.set_repository_topics(owner, repo, new_topics + topics).json()
 
     def get_repo_by_id(self, repo_id: int) -> Response:
-        return self.get(self.base_url + GitHubInstance.Endpoints.REPO_BY_ID.format(repo_id))
+        return self.get(self._url(GitHubInstance.Endpoints.REPO_BY_ID, repo_id))
+
+    def graphql(self, query: str, variables: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Runs a GraphQL query against the GitHub instance. GitHub Enterprise
+        serves GraphQL at /api/graphql alongside the /api/v3 REST api
+
+        :param query: The GraphQL query to run
+        :param variables: The variables used by the query
+        :return: The data returned by the query, fields that could not be
+            resolved, ie users that don't exist, are None
+        """
+        base_url = self.base_url[:-3] if self.base_url.endswith("/v3") else self.base_url
+        response = self.post(
+            base_url + "/graphql", json={"query": query, "variables": variables or {}}
+        ).json()
+        if response.get("data") is None:
+            raise GithubException(response["errors"][0]["message"])
+        data: Dict[str, Any] = response["data"]
+        return data
+
+    def _graphql_batch(
+        self, keys: List[Any], variable_types: str, selection: str
+    ) -> Dict[Any, Optional[Dict[str, Any]]]:
+        # Aliases one lookup per key in every query so a single request
+        # resolves up to GRAPHQL_BATCH_SIZE objects
+        results: Dict[Any, Optional[Dict[str, Any]]] = {}
+        for start in range(0, len(keys), GitHubInstance.GRAPHQL_BATCH_SIZE):
+            end = start + GitHubInstance.GRAPHQL_BATCH_SIZE
+            batch = keys[start:end]
+            variables: Dict[str, Any] = {}
+            declarations = []
+            lookups = []
+            for index, key in enumerate(batch):
+                names = [f"a{index}_{position}" for position in range(len(key))]
+                variables.update(zip(names, key))
+                declarations.append(variable_types % tuple(f"${name}" for name in names))
+                lookups.append(f"a{index}: " + selection % tuple(f"${name}" for name in names))
+            data = self.graphql(
+                "query(%s) { %s }" % (", ".join(declarations), " ".join(lookups)), variables
+            )
+            for index, key in enumerate(batch):
+                results[key] = data.get(f"a{index}")
+        return results
+
+    def get_users_batch(self, logins: List[str]) -> Dict[str, Optional[GitHubUser]]:
+        """
+        Gets many users with as few requests as possible by batching the
+        lookups into GraphQL queries. The users only contain the login, id,
+        name, email, site_admin and suspended_at fields of the REST api
+
+        :param logins: The logins of the users to get
+        :return: The users by login, None for users that don't exist
+        """
+        results = self._graphql_batch(
+            [(login,) for login in logins],
+            "%s: String!",
+            "user(login: %s) { " + GitHubInstance.GRAPHQL_USER_FIELDS + " }",
+        )
+        users: Dict[str, Optional[GitHubUser]] = {}
+        for (login,), user in results.items():
+            users[login] = (
+                cast(
+                    GitHubUser,
+                    {
+                        "login": user["login"],
+                        "id": user["databaseId"],
+                        "name": user["name"],
+                        "email": user["email"] or None,
+                        "site_admin": user["isSiteAdmin"],
+                        "suspended_at": user["suspendedAt"],
+                    },
+                )
+                if user
+                else None
+            )
+        return users
 
     def get_user(self, user_name: str) -> Response:
-        return self.get(self.base_url + GitHubInstance.Endpoints.USER_BY_NAME.format(user_name))
+        return self.get(self._url(GitHubInstance.Endpoints.USER_BY_NAME, user_name))
 
     def get_repo(self, login: str, repo: str) -> Response:
-        return self.get(self.base_url + GitHubInstance.Endpoints.REPO.format(login, repo))
+        return self.get(self._url(GitHubInstance.Endpoints.REPO, login, repo))
 
     def get_repo_collaborators(self, login: str, repo: str) -> Generator[GitHubUser, None, None]:
         return self.get_paginated_response(  # type:  ignore
-            self.base_url + GitHubInstance.Endpoints.REPO_COLLABORATORS.format(login, repo)
+            self._url(GitHubInstance.Endpoints.REPO_COLLABORATORS, login, repo)
         )
 
     def get_org(self, org_name: str) -> Response:
-        return self.get(
-            self.base_url + GitHubInstance.Endpoints.ORGANIZATIONS_BY_NAME.format(org_name)
-        )
+        return self.get(self._url(GitHubInstance.Endpoints.ORGANIZATIONS_BY_NAME, org_name))
 
     def get_org_members(self, org_name: str) -> Generator[GitHubUser, None, None]:
         return self.get_paginated_response(  # type:  ignore
-            self.base_url + GitHubInstance.Endpoints.ORGANIZATION_MEMBERS.format(org_name)
+            self._url(GitHubInstance.Endpoints.ORGANIZATION_MEMBERS, org_name)
         )
 
     def get_org_admins(self, org_name: str) -> Generator[GitHubUser, None, None]:
         return self.get_paginated_response(  # type:  ignore
-            self.base_url
-            + GitHubInstance.Endpoints.ORGANIZATION_MEMBERS.format(org_name)
-            + "?role=admin"
+            self._url(GitHubInstance.Endpoints.ORGANIZATION_MEMBERS, org_name) + "?role=admin"
         )
 
     def get_teams(self, org_name: str) -> Generator[GitHubTeam, None, None]:
         return self.get_paginated_response(  # type:  ignore
-            self.base_url + GitHubInstance.Endpoints.TEAMS.format(org_name)
+            self._url(GitHubInstance.Endpoints.TEAMS, org_name)
         )
 
     def get_team_repos(self, org_id: int, team_id: int) -> Generator[GitHubRepo, None, None]:
         return self.get_paginated_response(  # type:  ignore
-            self.base_url + GitHubInstance.Endpoints.TEAM_REPOS.format(org_id, team_id)
+            self._url(GitHubInstance.Endpoints.TEAM_REPOS, org_id, team_id)
         )
 
     def get_team_members(self, org_name: str, team_slug: str) -> Generator[GitHubUser, None, None]:
         return self.get_paginated_response(  # type:  ignore
-            self.base_url + GitHubInstance.Endpoints.TEAM_MEMBERS.format(org_name, team_slug)
+            self._url(GitHubInstance.Endpoints.TEAM_MEMBERS, org_name, team_slug)
         )
 
     def get_license_info(self) -> Response:
-        return self.get(self.base_url + self.Endpoints.LICENSE_INFO)
+        return self.get(self._url(GitHubInstance.Endpoints.LICENSE_INFO))
 
     def get_impersonation_token(self, username: str) -> str:
         """
@@ -443,16 +886,27 @@ class GitHubInstance:
         :param username: The user to be impersonated
         :return: Impersonation token for the given user
         """
+        token = self._create_impersonation_token(username)
+        self._validate_token(token)
+        return token
+
+    def _create_impersonation_token(self, username: str) -> str:
         if self.impersonating:
             # Can't create a new Github impersonation token with an impersonated instance
             raise InvalidImpersonationError
 
-        response = self.create_impersonation_token(username, GitHubInstance.ALL_SCOPES).json()
-        token: str = response["token"]
+        # GitHub hands out the same token for a user until it is deleted, so
+        # it is only requested once per user
+        token = self._impersonation_tokens.get(username)
+        if token is None:
+            response = self.create_impersonation_token(username, GitHubInstance.ALL_SCOPES).json()
+            token = self._impersonation_tokens[username] = response["token"]
+        return token
 
+    def _validate_token(self, token: str) -> None:
         # Test token and raise issues with it, especially to catch suspended users
-        response = get(
-            self.base_url + GitHubInstance.Endpoints.RATE_LIMIT,
+        response = self._session.get(
+            self._url(GitHubInstance.Endpoints.RATE_LIMIT),
             headers={"Authorization": f"Bearer {token}"},
         )
         try:
@@ -460,57 +914,71 @@ class GitHubInstance:
         except HTTPError as e:
             GitHubInstance.raise_error(e)
 
-        return token
-
     def create_impersonation_token(self, username: str, scopes: List[str]) -> Response:
         return self.post(
-            self.base_url + GitHubInstance.Endpoints.IMPERSONATE.format(username),
+            self._url(GitHubInstance.Endpoints.IMPERSONATE, username),
             json={"scopes": scopes},
         )
 
     def delete_impersonation_token(self, username: str) -> Response:
-        return self.delete(self.base_url + GitHubInstance.Endpoints.IMPERSONATE.format(username))
+        self._impersonation_tokens.pop(username, None)
+        return self.delete(self._url(GitHubInstance.Endpoints.IMPERSONATE, username))
 
     @contextmanager
     def impersonate_user(self, username: str) -> Any:
         """
         Impersonates a user for the duration of the context manager.
-        If the user is suspened, also temporarily unsuspend them
+        The token isn't validated up front, if the first request made with it
+        fails because the user is suspended, the user is temporarily
+        unsuspended until the end of the context manager and the request is retried.
+        If the cached token has been revoked a new one is created and the
+        request is retried
 
         :param username: The user to be impersonated
         """
-        try:
-            token = self.get_impersonation_token(username)
-        except GithubAccountSuspendedException:
-            with self.temporarily_unsuspend_user(
-                username,
-                "Temporary unsuspension for impersonation",
-                "Resuspending after temporary suspension.",
-            ):
-                # yield from within the with statement to keep the user unsuspended
-                token = self.get_impersonation_token(username)
-                impersonated_github = GitHubInstance([token], impersonating=username)
+        token = self._create_impersonation_token(username)
+        # The impersonated instance rides on this instance's connection pool
+        impersonated_github = GitHubInstance(
+            [token], url=self.base_url, impersonating=username, session=self._session
+        )
+        with ExitStack() as stack:
+
+            def unsuspend() -> None:
+                stack.enter_context(
+                    self.temporarily_unsuspend_user(
+                        username,
+                        "Temporary unsuspension for impersonation",
+                        "Resuspending after temporary suspension.",
+                    )
+                )
+
+            def refresh_token() -> str:
+                # The cached token is dropped so a new one is created for the user
+                self._impersonation_tokens.pop(username, None)
+                return self.get_impersonation_token(username)
+
+            impersonated_github._on_account_suspended = unsuspend
+            impersonated_github._on_bad_credentials = refresh_token
+            try:
                 yield impersonated_github
-        else:
-            impersonated_github = GitHubInstance([token], impersonating=username)
-            yield impersonated_github
+            finally:
+                impersonated_github.close()
 
     def set_organization_membership(self, org: str, username: str) -> Response:
         return self.put(
-            self.base_url
-            + GitHubInstance.Endpoints.SET_ORGANIZATION_MEMBERSHIP.format(org, username),
+            self._url(GitHubInstance.Endpoints.SET_ORGANIZATION_MEMBERSHIP, org, username),
             json={"role": "admin"},
         )
 
     def suspend_user(self, user: str, reason: str) -> Response:
         return self.put(
-            self.base_url + GitHubInstance.Endpoints.SUSPEND_USER.format(user),
+            self._url(GitHubInstance.Endpoints.SUSPEND_USER, user),
             json={"reason": reason},
         )
 
     def unsuspend_user(self, user: str, reason: str) -> Response:
         return self.delete(
-            self.base_url + GitHubInstance.Endpoints.SUSPEND_USER.format(user),
+            self._url(GitHubInstance.Endpoints.SUSPEND_USER, user),
             json={"reason": reason},
         )
 
@@ -3,7 +3,7 @@
 
 # pylint: disable=inherit-non-class,too-few-public-methods
 
-from typing import Any, Dict, List, TypedDict, Union
+from typing import Any, Dict, List, Optional, TypedDict, Union
 
 
 class GitHubUser(TypedDict):
@@ -30,6 +30,7 @@ class GitHubUser(TypedDict):
     type: str
     site_admin: bool
     ldap_dn: str
+    suspended_at: Optional[str]
 
 
 class GithubParentRepo(TypedDict):
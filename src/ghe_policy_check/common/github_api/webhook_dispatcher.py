@@ -3,7 +3,7 @@
 
 import hmac
 import logging
-from hashlib import sha1
+from hashlib import sha1, sha256
 from typing import Any, Callable, Dict, Optional, Union
 
 from django.conf import settings
@@ -14,6 +14,11 @@ from rest_framework.status import HTTP_204_NO_CONTENT, HTTP_501_NOT_IMPLEMENTED
 
 logger = logging.getLogger(__name__)
 
+# Webhook signatures are checked on every request, the OpenSSL implementations
+# of SHA-1 and SHA-256 use the SHA extensions of the CPU where they are available
+if type(sha256()).__module__ != "_hashlib":
+    logger.warning("hashlib is not backed by OpenSSL, webhook signature checks will be slow")
+
 
 class NoHeaderSignatureException(Exception):
     pass
@@ -37,6 +42,21 @@ class UnhandledActionException(Exception):
 
 WebhookHandler = Callable[[Any], Any]
 
+_DISPATCHER: Optional["WebhookDispatcher"] = None
+
+
+def _get_dispatcher() -> "WebhookDispatcher":
+    """
+    Returns the dispatcher for the configured webhook key, building it on first use
+
+    :return: The shared dispatcher
+    :rtype: WebhookDispatcher
+    """
+    global _DISPATCHER  # pylint: disable=global-statement
+    if _DISPATCHER is None:
+        _DISPATCHER = WebhookDispatcher(settings.GITHUB_WEBHOOK_KEY)
+    return _DISPATCHER
+
 
 def dispatch_webhook(request: Request) -> HttpResponse:
     """
@@ -48,16 +68,20 @@ def dispatch_webhook(request: Request) -> HttpResponse:
     :rtype: HTTPResponse
     """
     logger.info("Received webhook request")
+    # The body has to be read before request.data consumes the request stream,
+    # the same bytes are then hashed in place to verify the signature. The JSON
+    # payload is only parsed once the signature has been verified
     body = request.body
     event = request.headers["X-GitHub-Event"]
-    action = request.data.get("action")
-    dispatcher = WebhookDispatcher(settings.GITHUB_WEBHOOK_KEY)
     try:
-        response: Response = dispatcher.dispatch(
+        response: Response = _get_dispatcher().dispatch(
             request=request,
             event=event,
-            action=action,
-            signature=request.META.get("HTTP_X_HUB_SIGNATURE"),
+            # GitHub sends both signatures, SHA-1 is only checked for senders without SHA-256
+            signature=(
+                request.META.get("HTTP_X_HUB_SIGNATURE_256")
+                or request.META.get("HTTP_X_HUB_SIGNATURE")
+            ),
             body=body,
         )
     except UnhandledEventException:
@@ -69,7 +93,7 @@ def dispatch_webhook(request: Request) -> HttpResponse:
     except InvalidSignature:
         return HttpResponseForbidden("Permission denied.")
 
-    logger.info("Handling event: '%s.%s'", event, action)
+    logger.info("Handling event: '%s.%s'", event, request.data.get("action"))
     return response
 
 
@@ -79,15 +103,23 @@ class WebhookDispatcher:
     of those registered functions.
     """
 
+    __slots__ = ("secret", "_hmac_templates")
+
     registry: Dict[str, Union[WebhookHandler, Dict[str, WebhookHandler]]] = {}
 
     def __init__(self, secret: str):
         self.secret = secret
+        # The key schedule is derived once, each request copies the keyed state
+        self._hmac_templates = {
+            "sha256": hmac.new(secret.encode(), digestmod=sha256),
+            "sha1": hmac.new(secret.encode(), digestmod=sha1),
+        }
 
     def secure_github_request(self, signature: str, body: bytes) -> None:
         """
         Validates a provided signature matches what would be expected
-        and raises an :class:`InvalidSignature` if it does not match
+        and raises an :class:`InvalidSignature` if it does not match.
+        Both ``sha256`` and ``sha1`` signatures are supported
 
         :param signature: The provided signature from the request
         :param body: The body of the request used in validated the signature
@@ -97,10 +129,16 @@ class WebhookDispatcher:
 
         sha_name, signature_body = signature.split("=")
 
-        if sha_name != "sha1":
+        hmac_template = self._hmac_templates.get(sha_name)
+        if hmac_template is None:
             raise OperationNotSupportedException
-        mac = hmac.new(self.secret.encode(), msg=body, digestmod=sha1)
-        if not hmac.compare_digest(mac.hexdigest(), signature_body):
+        try:
+            provided = bytes.fromhex(signature_body)
+        except ValueError as error:
+            raise InvalidSignature from error
+        mac = hmac_template.copy()
+        mac.update(body)
+        if not hmac.compare_digest(mac.digest(), provided):
             raise InvalidSignature
 
     @classmethod
@@ -110,7 +148,8 @@ class WebhookDispatcher:
         """
         Registers a decorated function to handle the action specified in the decorator.
         If no action is provided the function will be registered to handle all
-        actions of that event type.s
+        actions of that event type. Events and actions are registered lower
+        cased, matching how GitHub sends them
 
         :param event: The GitHub event to associate the action with
         :param action: An optional specific GitHub action to register the function with
@@ -126,19 +165,18 @@ class WebhookDispatcher:
 
                 event_registry[action.lower()] = handler
             else:
-                cls.registry[event] = handler
+                cls.registry[event.lower()] = handler
             return handler
 
         return decorator
 
-    def dispatch(self, request: Any, event: str, action: str, signature: str, body: bytes) -> Any:
+    def dispatch(self, request: Any, event: str, signature: str, body: bytes) -> Any:
         """
         Dispatches a webhook to its registered function, verifying the signature
-        of the request
+        of the request before its payload is parsed for the action
 
         :param request: The incoming :class:`HTTPRequest`
         :param event: The name of the GitHub event
-        :param action: The name of the GitHub action
         :param signature: The signature of the webhook
         :param body: The body of the incoming request
         :return: Passes on the return value from the registered function
@@ -146,7 +184,7 @@ class WebhookDispatcher:
         """
         self.secure_github_request(signature, body)
 
-        event_handler = self.registry.get(event.lower())
+        event_handler = self.registry.get(event)
 
         if not event_handler:
             raise UnhandledActionException(f"Unhandled event: {event}")
@@ -154,9 +192,11 @@ class WebhookDispatcher:
         # Allow a method to handle event
         if callable(event_handler):
             return event_handler(request)
+        action = request.data.get("action")
         if not action:
             raise UnhandledActionException(f"Unhandled event: {event}")
 
+        # Actions are registered lower cased
         action_handler = event_handler.get(action.lower())
         if not action_handler:
             raise UnhandledActionException(f"Unhandled action: {event}.{action}")
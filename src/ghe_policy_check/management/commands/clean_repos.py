@@ -1,41 +1,102 @@
 # Copyright (c) 2022, Qualcomm Innovation Center, Inc. All rights reserved.
 # SPDX-License-Identifier: BSD-3-Clause
 
-from typing import Any, Dict, List
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Dict, List, Optional
 
 from django.conf import settings
 from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from requests import RequestException
 
 from ghe_policy_check.common.github_api.github_instance import (
+    GithubException,
     GithubNotFoundException,
     GithubRepositoryBlockedException,
 )
 from ghe_policy_check.configuration import GHEPolicyCheckConfiguration  # type: ignore
+from ghe_policy_check.utils import get_github_instance
+
+logger = logging.getLogger(__name__)
 
 
 class Command(BaseCommand):
     help = "Cleans all local repos by updating visibility and removing lost repos"
+    # The default of settings.CLEAN_REPOS_WORKERS, the workers share the paced
+    # rate limit of the admin tokens
+    WORKERS = 4
+    BATCH_SIZE = 500
 
-    def handle(
-        self, *args: List[Any], **kwargs: Dict[Any, Any]  # pylint: disable=unused-argument
-    ) -> None:
+    @staticmethod
+    def _refresh_repo(repo: GHEPolicyCheckConfiguration.Repo, username: str) -> Optional[bool]:
         """
-        Updates visibility of repos and deletes local repos that no longer
-        exist in the GitHub Instance
+        Updates the visibility of a local repo from GitHub without saving it.
+        Each worker thread impersonates the owner with its own GitHub instance
+
+        :param repo: The local repo to update
+        :param username: The username of the owner of the repo
+        :return: True if the visibility changed, False if the repo no longer
+            exists in the GitHub instance and None if there is nothing to update
         """
-        github = GHEPolicyCheckConfiguration.GitHubInstance(settings.GITHUB_ADMIN_TOKENS)
-        for repo in GHEPolicyCheckConfiguration.Repo.objects.all():
-            login, _, name = repo.repo_name.partition("/")
-            with github.impersonate_user(repo.owner.username) as impersonated_gh:
+        login, _, name = repo.repo_name.partition("/")
+        github = get_github_instance(settings.GITHUB_ADMIN_TOKENS)
+        try:
+            with github.impersonate_user(username) as impersonated_gh:
                 try:
                     resp = impersonated_gh.get_repo(login, name).json()
                 except GithubRepositoryBlockedException:
-                    continue
+                    return None
                 except GithubNotFoundException:
-                    # Delete repos we no longer have access to
-                    if resp.get("message") == "Not Found":
-                        repo.delete()
-                        continue
+                    return False
+        except (GithubException, RequestException):
+            # A repo that can't be refreshed is left as is for the next run
+            logger.exception("Unable to refresh repo '%s'", repo.repo_name)
+            return None
+
+        if repo.visibility == resp["visibility"]:
+            return None
+        repo.visibility = resp["visibility"]
+        return True
+
+    def handle(
+        self, *args: List[Any], **kwargs: Dict[Any, Any]  # pylint: disable=unused-argument
+    ) -> None:
+        """
+        Updates visibility of repos and deletes local repos that no longer
+        exist in the GitHub Instance. The repos are fetched from GitHub
+        concurrently and the changes of every batch are written to the database
+        in bulk before the next batch is fetched
+        """
+        # Only the current batch is kept in memory while the rest are streamed
+        repos = (
+            GHEPolicyCheckConfiguration.Repo.objects.select_related("owner")
+            .only("id", "repo_name", "visibility", "owner__username")
+            .iterator(chunk_size=Command.BATCH_SIZE)
+        )
+        workers = getattr(settings, "CLEAN_REPOS_WORKERS", Command.WORKERS)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                batch = [(repo, repo.owner.username) for repo in islice(repos, Command.BATCH_SIZE)]
+                if not batch:
+                    break
+                results = executor.map(lambda repo: self._refresh_repo(*repo), batch)
+                now = timezone.now()
+                to_save = []
+                to_delete = []
+                for (repo, _), changed in zip(batch, results):
+                    if changed:
+                        # bulk_update doesn't set the modified timestamp like save does
+                        repo.modified = now
+                        to_save.append(repo)
+                    elif changed is False:
+                        # Delete repos we no longer have access to
+                        to_delete.append(repo.pk)
 
-            repo.visibility = resp["visibility"]
-            repo.save()
+                with transaction.atomic():
+                    GHEPolicyCheckConfiguration.Repo.objects.bulk_update(
+                        to_save, ["visibility", "modified"]
+                    )
+                    GHEPolicyCheckConfiguration.Repo.objects.filter(pk__in=to_delete).delete()
@@ -2,16 +2,15 @@
 # SPDX-License-Identifier: BSD-3-Clause
 
 import hmac
-import json
 import logging
 from argparse import ArgumentParser
-from hashlib import sha1
+from hashlib import sha1, sha256
 from typing import Any, Dict, List
 
-import requests
 from django.conf import settings
 from django.core.management import BaseCommand
-from django.utils.encoding import force_bytes
+from requests import Session
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +20,9 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser: ArgumentParser) -> None:
         parser.add_argument("--url", nargs=1, type=str, help="URL to webhook endpoint")
-        parser.add_argument("--path", nargs=1, type=str, help="Absolute path to request body")
+        parser.add_argument(
+            "--path", nargs="+", type=str, help="Absolute paths to one or more request bodies"
+        )
         parser.add_argument("--event", nargs=1, type=str, help="Github event type")
         parser.add_argument(
             "--key",
@@ -35,23 +36,36 @@ class Command(BaseCommand):
         self, *args: List[str], **kwargs: Dict[Any, Any]  # pylint: disable=unused-argument
     ) -> None:
         """
-        Resends a GitHub event based on the passed parameter.
-        Helpful for debugging a webhook request or replaying it once
-        a bug has been fixed
+        Resends GitHub events based on the passed parameters, one for each
+        request body path. Helpful for debugging a webhook request or
+        replaying it once a bug has been fixed
         """
         url = kwargs["url"][0]
-        file_path = kwargs["path"][0]
         webhook_key = kwargs["key"][0]
         github_event = kwargs["event"][0]
 
-        with open(file_path) as file:
-            body = file.read()
-
-        request_json = json.loads(body)
-        request_body = json.dumps(json.loads(body)).encode()
-        sha1_hash = hmac.new(
-            force_bytes(webhook_key), force_bytes(request_body), digestmod=sha1
-        ).hexdigest()
-        headers = {"x-hub-signature": f"sha1={sha1_hash}", "x-github-event": github_event}
-        resp = requests.post(url=url, headers=headers, json=request_json)
-        print(resp.status_code, resp.reason)
+        # Reuse one connection to the webhook endpoint for every event
+        session = Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=10)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        try:
+            for file_path in kwargs["path"]:
+                # The recorded body is sent as is so the signed bytes are the sent bytes
+                with open(file_path, "rb") as file:
+                    request_body = file.read()
+
+                sha1_hash = hmac.new(webhook_key.encode(), request_body, digestmod=sha1).hexdigest()
+                sha256_hash = hmac.new(
+                    webhook_key.encode(), request_body, digestmod=sha256
+                ).hexdigest()
+                headers = {
+                    "content-type": "application/json",
+                    "x-hub-signature": f"sha1={sha1_hash}",
+                    "x-hub-signature-256": f"sha256={sha256_hash}",
+                    "x-github-event": github_event,
+                }
+                resp = session.post(url=url, headers=headers, data=request_body)
+                print(resp.status_code, resp.reason)
+        finally:
+            session.close()
@@ -5,24 +5,34 @@
 import datetime
 import logging
 from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from typing import Any, Dict, List
 
 import pytz
 from django.conf import settings
 from django.core.management import BaseCommand
+from django.utils import timezone
+from requests import RequestException
 
 from ghe_policy_check.common.github_api.github_instance import (
     GithubClientException,
+    GithubException,
     GithubNotFoundException,
     GithubRepositoryBlockedException,
 )
 from ghe_policy_check.configuration import GHEPolicyCheckConfiguration
+from ghe_policy_check.utils import get_github_instance
 
 logger = logging.getLogger(__name__)
 
 SUSPEND_MESSAGE = "Resuspending after temporary suspension."
 UNSUSPEND_MESSAGE = "Temporary unsuspension to inventory forks."
 ISO_8601_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+BATCH_SIZE = 500
+# The default of settings.SYNC_FORKS_WORKERS, the workers share the paced rate
+# limit of the admin tokens
+WORKERS = 4
 
 
 def _parse_iso_8601(time: str) -> datetime.datetime:
@@ -42,31 +52,37 @@ def _get_forks(
     return forks
 
 
-def _add_forks(
-    local_repo: GHEPolicyCheckConfiguration.Repo, github: GHEPolicyCheckConfiguration.GitHubInstance
-) -> None:
+def _fetch_forks(local_repo: GHEPolicyCheckConfiguration.Repo) -> Any:
+    # Each worker thread fetches the forks with its own GitHub instance
+    github = get_github_instance(settings.GITHUB_ADMIN_TOKENS)
     try:
-        forks = _get_forks(local_repo, github)
-    except GithubClientException:
-        forks = _get_forks(local_repo, github)
+        try:
+            return _get_forks(local_repo, github)
+        except GithubClientException:
+            return _get_forks(local_repo, github)
+    except (GithubException, RequestException):
+        # A repo whose forks can't be fetched doesn't stop the others from syncing
+        logger.exception("Unable to get forks of '%s'", local_repo.repo_name)
+        return None
+
 
+def _add_forks(local_repo: GHEPolicyCheckConfiguration.Repo, forks: Any) -> None:
     if not forks:
         return
 
-    for github_fork in forks:
-        try:
-            local_fork = GHEPolicyCheckConfiguration.Repo.objects.get(
-                repo_name=github_fork["full_name"]
-            )
-        except GHEPolicyCheckConfiguration.Repo.DoesNotExist:
-            logger.exception(
-                "Did not find fork '%s' of '%s' in local db",
-                github_fork["full_name"],
-                local_repo.repo_name,
-            )
-            continue
-        local_fork.fork_source = local_repo
-        local_fork.save()
+    fork_names = [github_fork["full_name"] for github_fork in forks]
+    local_forks = GHEPolicyCheckConfiguration.Repo.objects.filter(repo_name__in=fork_names)
+    found_forks = set(local_forks.values_list("repo_name", flat=True))
+    # update doesn't set the modified timestamp like save does
+    local_forks.update(fork_source=local_repo, modified=timezone.now())
+
+    missing_forks = set(fork_names) - found_forks
+    if missing_forks:
+        logger.error(
+            "Did not find forks %s of '%s' in local db",
+            ", ".join(f"'{fork}'" for fork in sorted(missing_forks)),
+            local_repo.repo_name,
+        )
 
 
 class Command(BaseCommand):
@@ -87,11 +103,23 @@ class Command(BaseCommand):
         """
         Syncs the forks of all local repositories against the GitHub instance.
         """
-        github = GHEPolicyCheckConfiguration.GitHubInstance(settings.GITHUB_ADMIN_TOKENS)
-
         created = kwargs["created"][0]
-        queryset = GHEPolicyCheckConfiguration.Repo.objects.order_by("created")
+        queryset = (
+            GHEPolicyCheckConfiguration.Repo.objects.select_related("owner")
+            .only("id", "repo_name", "owner__username")
+            .order_by("created")
+        )
         queryset = queryset.filter(created__gte=_parse_iso_8601(created)) if created else queryset
 
-        for repo in queryset.all():
-            _add_forks(repo, github)
+        # The forks are fetched from GitHub concurrently while the command's
+        # thread writes them to the database
+        repos = queryset.iterator(chunk_size=1000)
+        workers = getattr(settings, "SYNC_FORKS_WORKERS", WORKERS)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                batch = list(islice(repos, BATCH_SIZE))
+                if not batch:
+                    break
+                results = executor.map(_fetch_forks, batch)
+                for repo, forks in zip(batch, results):
+                    _add_forks(repo, forks)
@@ -0,0 +1,36 @@
+# Copyright (c) 2022, Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+
+# Generated by Django 3.1 on 2026-10-15 21:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ghe_policy_check", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="basicrepo",
+            index=models.Index(fields=["created"], name="ghe_policy__created_a917d4_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="basicrepo",
+            index=models.Index(
+                fields=["last_polling_check"], name="ghe_policy__last_po_30a45b_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="basicrepo",
+            index=models.Index(
+                fields=["classification_modified"], name="ghe_policy__classif_877bdd_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="basicuser",
+            index=models.Index(fields=["last_synced"], name="ghe_policy__last_sy_dff7c4_idx"),
+        ),
+    ]
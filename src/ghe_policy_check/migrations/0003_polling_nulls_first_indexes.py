@@ -0,0 +1,47 @@
+# Copyright (c) 2022, Qualcomm Innovation Center, Inc. All rights reserved.
+# SPDX-License-Identifier: BSD-3-Clause
+
+from typing import Any
+
+from django.db import migrations
+
+# Polling orders by these columns ascending with nulls first. SQLite and MySQL
+# sort nulls first by default so the plain indexes already match, PostgreSQL
+# sorts them last and needs indexes built in the polling order
+POLLING_INDEXES = [
+    ("basicrepo", "last_polling_check", "ghe_policy_repo_lpc_nf_idx"),
+    ("basicuser", "last_synced", "ghe_policy_user_ls_nf_idx"),
+]
+
+
+def create_indexes(apps: Any, schema_editor: Any) -> None:
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for model_name, column, index_name in POLLING_INDEXES:
+        table = apps.get_model("ghe_policy_check", model_name)._meta.db_table
+        schema_editor.execute(
+            "CREATE INDEX %s ON %s (%s ASC NULLS FIRST)"
+            % (
+                schema_editor.quote_name(index_name),
+                schema_editor.quote_name(table),
+                schema_editor.quote_name(column),
+            )
+        )
+
+
+def drop_indexes(apps: Any, schema_editor: Any) -> None:  # pylint: disable=unused-argument
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for _, _, index_name in POLLING_INDEXES:
+        schema_editor.execute("DROP INDEX %s" % schema_editor.quote_name(index_name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ghe_policy_check", "0002_add_polling_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
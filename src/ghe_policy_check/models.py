@@ -4,10 +4,16 @@
 # pylint: disable=too-few-public-methods
 import datetime
 import logging
-from typing import List, Optional
+import time
+from collections import OrderedDict
+from functools import lru_cache, partial
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple, Type, TypeVar
 
 from django.conf import settings
-from django.db import IntegrityError, models
+from django.db import IntegrityError, models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 from django_extensions.db.models import TimeStampedModel
 
@@ -15,6 +21,121 @@ from ghe_policy_check.common.github_api.types import GitHubOrg, GitHubTeam, GitH
 
 logger = logging.getLogger(__name__)
 
+ModelType = TypeVar("ModelType", bound=models.Model)
+
+
+class _GitHubIdCache:
+    """
+    A TTL bounded LRU of rows looked up by their GitHub id. Webhook bursts
+    reference the same senders and orgs repeatedly, this saves a query for
+    each repeat. Only committed rows are cached and saving or deleting a row
+    drops it from the cache
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[type, int], Tuple[float, Any, Dict[str, Any]]]" = (
+            OrderedDict()
+        )
+        self._keys: Dict[Tuple[type, Any], Tuple[type, int]] = {}
+        self._lock = Lock()
+
+    def get(self, model: Type[ModelType], github_id: Any) -> Optional[ModelType]:
+        """
+        Returns a fresh instance of the cached row for the GitHub id, if there is one
+
+        :param model: The model the row belongs to
+        :param github_id: The GitHub id of the row
+        :return: The cached row or None
+        """
+        key = (model, int(github_id))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, _, values = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+        instance: ModelType = model.from_db(None, list(values), list(values.values()))
+        return instance
+
+    def add(self, instance: models.Model) -> None:
+        """
+        Caches the row once the current transaction commits
+
+        :param instance: The row to cache
+        """
+        transaction.on_commit(partial(self._store, instance))
+
+    def _store(self, instance: models.Model) -> None:
+        model = type(instance)
+        values = {
+            field.attname: getattr(instance, field.attname)
+            for field in instance._meta.concrete_fields
+        }
+        key = (model, int(values["github_id"]))
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, instance.pk, values)
+            self._keys[(model, instance.pk)] = key
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, instance: models.Model) -> None:
+        """
+        Drops a row from the cache
+
+        :param instance: The row that changed
+        """
+        with self._lock:
+            key = self._keys.get((type(instance), instance.pk))
+            if key is not None:
+                self._remove(key)
+
+    def clear(self) -> None:
+        """
+        Drops every row from the cache
+        """
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+
+    def _remove(self, key: Tuple[type, int]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._keys.pop((key[0], entry[1]), None)
+
+
+_GITHUB_ID_CACHE = _GitHubIdCache(maxsize=4096, ttl=60)
+
+
+def invalidate_github_id_cache(instance: models.Model) -> None:
+    """
+    Drops a row from the GitHub id cache. Saving or deleting a row already
+    does this, rows changed with ``update`` or ``bulk_update`` have to be
+    dropped explicitly. The cache is per process, other processes can keep
+    serving the stale row until it expires after 60 seconds
+
+    :param instance: The row that changed
+    """
+    _GITHUB_ID_CACHE.invalidate(instance)
+
+
+def clear_github_id_cache() -> None:
+    """
+    Drops every row from the GitHub id cache of the current process
+    """
+    _GITHUB_ID_CACHE.clear()
+
+
+@lru_cache(maxsize=None)
+def _reminder_period(reminder_minutes: int) -> datetime.timedelta:
+    # Give a small 30 second buffer time
+    return datetime.timedelta(minutes=reminder_minutes, seconds=-30)
+
 
 class User(TimeStampedModel):
     """
@@ -23,6 +144,7 @@ class User(TimeStampedModel):
 
     class Meta:
         abstract = True
+        indexes = [models.Index(fields=["last_synced"])]
 
     username = models.CharField(max_length=255, unique=True)
     github_id = models.IntegerField(unique=True)
@@ -41,21 +163,33 @@ class User(TimeStampedModel):
         :return: A copy of the given .. py:class::GitHubUser
         :rtype: User
         """
+        cached_user = _GITHUB_ID_CACHE.get(cls, github_user["id"])
+        if cached_user is not None:
+            return cached_user
         try:
             user: User = cls.objects.get(github_id=github_user["id"])
         except cls.DoesNotExist:
+            # Multiple webhooks might try to create the user simultaneously, the
+            # conflicting inserts are ignored and the created user is read back
+            cls.objects.bulk_create(
+                [
+                    cls(
+                        username=github_user["login"],
+                        github_id=github_user["id"],
+                        suspended_at=github_user.get("suspended_at"),
+                    )
+                ],
+                ignore_conflicts=True,
+            )
             try:
-                user, _ = cls.objects.update_or_create(
-                    username=github_user["login"],
-                    defaults={
-                        "github_id": github_user["id"],
-                        "suspended_at": github_user.get("suspended_at"),
-                    },
-                )
-            except IntegrityError:
-                # Multiple webhooks might try to create the user simultaneously
-                # Check if another webhook created the user and return that
                 user = cls.objects.get(github_id=github_user["id"])
+            except cls.DoesNotExist:
+                # An old user with the same username exists, take it over
+                user = cls.objects.get(username=github_user["login"])
+                user.github_id = github_user["id"]
+                user.suspended_at = github_user.get("suspended_at")
+                user.save(update_fields=["github_id", "suspended_at"])
+        _GITHUB_ID_CACHE.add(user)
         return user
 
     def __str__(self) -> str:
@@ -89,6 +223,9 @@ class Org(TimeStampedModel):
         :return: A copy of the given .. py:class::GitHubOrg
         :rtype: Org
         """
+        cached_org = _GITHUB_ID_CACHE.get(cls, github_org["id"])
+        if cached_org is not None:
+            return cached_org
         try:
             org: Org = cls.objects.get(github_id=github_org["id"])
         except cls.DoesNotExist:
@@ -102,6 +239,7 @@ class Org(TimeStampedModel):
                 # Multiple webhooks might try to create the org simultaneously
                 # Check if another webhook created the org and return that
                 org = cls.objects.get(github_id=github_org["id"])
+        _GITHUB_ID_CACHE.add(org)
         return org
 
     def __str__(self) -> str:
@@ -137,6 +275,9 @@ class Team(TimeStampedModel):
         :return: A copy of the given .. py:class::GitHubTeam
         :rtype: Team
         """
+        cached_team = _GITHUB_ID_CACHE.get(cls, github_team["id"])
+        if cached_team is not None:
+            return cached_team
         try:
             team: "Team" = cls.objects.get(github_id=github_team["id"])
         except cls.DoesNotExist:
@@ -146,6 +287,7 @@ class Team(TimeStampedModel):
                 team_slug=github_team["slug"],
                 org=org,
             )
+        _GITHUB_ID_CACHE.add(team)
         return team
 
     def __str__(self) -> str:
@@ -159,6 +301,11 @@ class Repo(TimeStampedModel):
 
     class Meta:
         abstract = True
+        indexes = [
+            models.Index(fields=["created"]),
+            models.Index(fields=["last_polling_check"]),
+            models.Index(fields=["classification_modified"]),
+        ]
 
     repo_name = models.CharField(max_length=255, unique=True)
     description = models.TextField(blank=True, null=True)
@@ -215,24 +362,30 @@ class Repo(TimeStampedModel):
 
         :param local_users: The new set of collaborators to replace the old collaborators
         """
+        current_ids = set(self.collaborators.values_list("id", flat=True))
+        new_ids = {user.pk for user in local_users}
         try:
-            self.collaborators.clear()
-            self.collaborators.add(*local_users)
-            self.save()
+            # Only the changed memberships are written, usually there are none
+            if current_ids - new_ids:
+                self.collaborators.remove(*(current_ids - new_ids))
+            if new_ids - current_ids:
+                self.collaborators.add(*(new_ids - current_ids))
         except IntegrityError:
             logger.warning("Integrity error with repo '%s'", self.repo_name)
 
-    def set_classification(self, classification: Optional[str]) -> None:
+    def set_classification(self, classification: Optional[str], save: bool = True) -> None:
         """
         Sets the classifiction field and the timestamp of when the classification was last modified
 
         :param classification: The new classification of the repo
+        :param save: Whether to save the repo, callers updating other fields can save it once
         """
         if self.classification == classification:
             return
         self.classification = classification
         self.classification_modified = timezone.now()
-        self.save()
+        if save:
+            self.save(update_fields=["classification", "classification_modified", "modified"])
 
     @property
     def is_non_compliant(self) -> bool:
@@ -251,12 +404,8 @@ class Repo(TimeStampedModel):
         """
         if not self.last_polling_check:
             return True
-        current_time = timezone.now()
-        # Give a small 30 second buffer time
-        reminder_period = datetime.timedelta(
-            minutes=settings.REMINDER_MINUTES
-        ) - datetime.timedelta(seconds=30)
-        return (self.last_polling_check + reminder_period) < current_time  # type: ignore
+        reminder_period = _reminder_period(settings.REMINDER_MINUTES)
+        return (self.last_polling_check + reminder_period) < timezone.now()  # type: ignore
 
     def __str__(self) -> str:
         return str(self.repo_name)
@@ -276,3 +425,12 @@ class BasicTeam(Team):
 
 class BasicRepo(Repo):
     pass
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def _invalidate_github_id_cache(
+    sender: type, instance: models.Model, **kwargs: Any  # pylint: disable=unused-argument
+) -> None:
+    if isinstance(instance, (User, Org, Team)):
+        invalidate_github_id_cache(instance)
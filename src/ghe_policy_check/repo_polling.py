@@ -2,7 +2,6 @@
 # SPDX-License-Identifier: BSD-3-Clause
 
 # pylint: disable=too-few-public-methods
-import math
 from datetime import datetime
 from typing import Callable, Optional
 
@@ -17,10 +16,31 @@ from ghe_policy_check.common.github_api.github_instance import (
 )
 from ghe_policy_check.common.github_api.types import GitHubRepo
 from ghe_policy_check.configuration import GHEPolicyCheckConfiguration  # type: ignore
-from ghe_policy_check.utils import get_classification, get_github_repo, get_org_owner
+from ghe_policy_check.utils import (
+    get_classification,
+    get_github_instance,
+    get_github_repo,
+    get_org_owner,
+    get_polling_batch_size,
+)
 
 logger = get_task_logger(__name__)
 
+# The repo fields written by polling, the owner of org repos can change while polling
+POLLED_FIELDS = [
+    "last_polling_check",
+    "owner",
+    "repo_name",
+    "size",
+    "description",
+    "classification",
+    "classification_modified",
+    "visibility",
+    "disabled",
+    "html_url",
+    "modified",
+]
+
 
 def _get_github_repo_and_handle_error(
     local_repo: GHEPolicyCheckConfiguration.Repo,
@@ -29,29 +49,13 @@ def _get_github_repo_and_handle_error(
         return get_github_repo(local_repo)
     except GithubRepositoryBlockedException:
         local_repo.disabled = True
-        local_repo.save()
+        local_repo.save(update_fields=["disabled", "last_polling_check", "owner", "modified"])
         return None
 
 
-def get_and_update_repo(
-    local_repo: GHEPolicyCheckConfiguration.Repo, last_polling_check: datetime
+def _get_github_repo_or_delete(
+    local_repo: GHEPolicyCheckConfiguration.Repo,
 ) -> Optional[GitHubRepo]:
-    """
-    Get a :class:`ghe_policy_check.common.github_api.types.GitHubRepo` from a
-    given :class:`github_automation.api.models.Repo` and update its values
-    accordingly.
-
-    This function can be extended or overwritten to customize behavior using
-    :class:`GetAndUpdateRepo`
-    :param local_repo: The Repo that will be updated
-    :param last_polling_check: The timestamp of when this repo is being updated
-    :return:
-    """
-    logger.debug("Updating repo %s", local_repo)
-
-    local_repo.last_polling_check = last_polling_check
-    local_repo.save()
-
     try:
         github_repo = _get_github_repo_and_handle_error(local_repo)
     except GithubNotFoundException:
@@ -78,6 +82,34 @@ def get_and_update_repo(
             )
             local_repo.delete()
             return None
+    return github_repo
+
+
+def get_and_update_repo(
+    local_repo: GHEPolicyCheckConfiguration.Repo, last_polling_check: datetime
+) -> Optional[GitHubRepo]:
+    """
+    Get a :class:`ghe_policy_check.common.github_api.types.GitHubRepo` from a
+    given :class:`github_automation.api.models.Repo` and update its values
+    accordingly.
+
+    This function can be extended or overwritten to customize behavior using
+    :class:`GetAndUpdateRepo`
+    :param local_repo: The Repo that will be updated
+    :param last_polling_check: The timestamp of when this repo is being updated
+    :return:
+    """
+    logger.debug("Updating repo %s", local_repo)
+
+    # The polling timestamp is written together with the rest of the repo
+    local_repo.last_polling_check = last_polling_check
+    try:
+        github_repo = _get_github_repo_or_delete(local_repo)
+    except Exception:
+        # Still move the repo to the back of the polling order when polling
+        # fails for any reason, ie a server or connection error
+        local_repo.save(update_fields=["last_polling_check"])
+        raise
 
     if not github_repo:
         return None
@@ -87,11 +119,11 @@ def get_and_update_repo(
     local_repo.repo_name = github_repo["full_name"]
     local_repo.size = github_repo["size"]
     local_repo.description = github_repo["description"]
-    local_repo.set_classification(cci_classification)
+    local_repo.set_classification(cci_classification, save=False)
     local_repo.visibility = github_repo["visibility"]
     local_repo.disabled = github_repo["disabled"]
     local_repo.html_url = github_repo["html_url"]
-    local_repo.save()
+    local_repo.save(update_fields=POLLED_FIELDS)
 
     return github_repo
 
@@ -107,11 +139,18 @@ def _update_repo_topics(
     elif local_repo.is_non_compliant:
         new_topics = [settings.NON_COMPLIANT_TOPIC]
 
+    existing_topics = github_repo.get("topics")
+    if new_topics and existing_topics is not None and set(new_topics).issubset(existing_topics):
+        return
+
     if new_topics:
         try:
             with github.impersonate_user(local_repo.owner.username) as impersonated_gh:
                 impersonated_gh.add_repository_topics(
-                    github_repo["owner"]["login"], github_repo["name"], new_topics
+                    github_repo["owner"]["login"],
+                    github_repo["name"],
+                    new_topics,
+                    existing_topics,
                 )
         except GithubException:
             return
@@ -131,7 +170,7 @@ def remind_repo(local_repo: GHEPolicyCheckConfiguration.Repo, github_repo: GitHu
     """
     logger.info("Reminding repo %s", local_repo)
 
-    github = GHEPolicyCheckConfiguration.GitHubInstance(settings.GITHUB_ADMIN_TOKENS)
+    github = get_github_instance(settings.GITHUB_ADMIN_TOKENS)
     _update_repo_topics(local_repo, github_repo, github)
 
 
@@ -143,18 +182,16 @@ def get_polling_repos() -> QuerySet[GHEPolicyCheckConfiguration.Repo]:
 
     :return: The Set of repos to be updated in a single polling period
     """
-    repos: QuerySet[
-        GHEPolicyCheckConfiguration.Repo
-    ] = GHEPolicyCheckConfiguration.Repo.objects.order_by(
-        F("last_polling_check").asc(nulls_first=True)
+    # The owners and orgs are read while polling every repo, so they are joined in
+    repos: QuerySet[GHEPolicyCheckConfiguration.Repo] = (
+        GHEPolicyCheckConfiguration.Repo.objects.select_related(
+            "owner", "org", "org__owner"
+        ).order_by(F("last_polling_check").asc(nulls_first=True))
     )
 
     # Divide repos evenly over the number of polling periods in an email reminded period
     # ie If an email is sent daily and the polling done hourly, break repos into 24 chunks
-    repos_per_polling_period = math.ceil(
-        repos.count() / (settings.REMINDER_MINUTES // settings.POLLING_PERIOD_MINUTES)
-    )
-    return repos[:repos_per_polling_period]
+    return repos[: get_polling_batch_size(GHEPolicyCheckConfiguration.Repo)]
 
 
 class GetPollingRepos:
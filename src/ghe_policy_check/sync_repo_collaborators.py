@@ -2,13 +2,13 @@
 # SPDX-License-Identifier: BSD-3-Clause
 
 from datetime import datetime
+from datetime import timezone as dt_timezone
 from typing import List, Optional
 
-import pytz
 from celery.utils.log import get_task_logger
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
-from ilock import ILock
 
 from ghe_policy_check.common.github_api.github_instance import (
     GithubAccountSuspendedException,
@@ -17,6 +17,7 @@ from ghe_policy_check.common.github_api.github_instance import (
 )
 from ghe_policy_check.common.github_api.types import GitHubUser
 from ghe_policy_check.configuration import GHEPolicyCheckConfiguration  # type: ignore
+from ghe_policy_check.utils import get_github_instance
 
 logger = get_task_logger(__name__)
 
@@ -26,10 +27,10 @@ TIME_FORMAT = "%Y%m%d%H%M%S%f"
 def _get_repo_collaborators(
     local_repo: GHEPolicyCheckConfiguration.Repo, retry: int = 0
 ) -> Optional[List[GitHubUser]]:
-    github = GHEPolicyCheckConfiguration.GitHubInstance(settings.GITHUB_ADMIN_TOKENS)
+    github = get_github_instance(settings.GITHUB_ADMIN_TOKENS)
     owner, _, repo_name = local_repo.repo_name.partition("/")
     local_repo.collaborators_synced = timezone.now()
-    local_repo.save()
+    local_repo.save(update_fields=["collaborators_synced"])
     with github.impersonate_user(local_repo.owner.username) as impersonated_github:
         try:
             return list(impersonated_github.get_repo_collaborators(owner, repo_name))
@@ -58,22 +59,24 @@ def run_sync_repo_collaborators(github_id: int, sent: str) -> None:
     # Github often fires many webhooks that cause a sync simultaneously
     # Only one sync is needed, so if a sync has been ran after the request to sync was sent
     # That request can safely be ignored
-    with ILock(str(github_id) + "-sync-repo-lock"):
+    sent_at = datetime.strptime(sent, TIME_FORMAT).replace(tzinfo=dt_timezone.utc)
+    # The repo row is locked while it is checked and stamped, which serializes
+    # the syncs of a repo across every worker host sharing the database
+    with transaction.atomic():
         try:
-            local_repo = GHEPolicyCheckConfiguration.Repo.objects.get(github_id=github_id)
+            local_repo = GHEPolicyCheckConfiguration.Repo.objects.select_for_update().get(
+                github_id=github_id
+            )
         except GHEPolicyCheckConfiguration.Repo.DoesNotExist:
             logger.error("Could not find repo with github id %s", github_id)
             return
 
-        if local_repo.collaborators_synced and (
-            datetime.strptime(sent, TIME_FORMAT).replace(tzinfo=pytz.UTC)
-            < local_repo.collaborators_synced
-        ):
+        if local_repo.collaborators_synced and sent_at < local_repo.collaborators_synced:
             logger.info("Skipping collaborators sync for repo '%s'", local_repo.repo_name)
             return
 
         local_repo.collaborators_synced = timezone.now()
-        local_repo.save()
+        local_repo.save(update_fields=["collaborators_synced"])
 
     logger.info("Syncing collaborators for repo '%s'", local_repo.repo_name)
 
@@ -86,16 +89,17 @@ def run_sync_repo_collaborators(github_id: int, sent: str) -> None:
 
         # Try getting the gh org owner in case the local owner has lost permissions
         local_repo.owner = local_repo.org.owner
-        local_repo.save()
+        local_repo.save(update_fields=["owner", "modified"])
         collaborators = _get_repo_collaborators(local_repo)
 
     if not collaborators:
         logger.info("Could not access collaborators for repo '%s'", local_repo.repo_name)
         return
+    # Only the ids of the users are needed to diff the collaborators
     local_repo.sync_collaborators(
         GHEPolicyCheckConfiguration.User.objects.filter(
             github_id__in=[github_user["id"] for github_user in collaborators]
-        )
+        ).only("id")
     )
 
     logger.info("Finished syncing collaborators for repo '%s'", local_repo.repo_name)
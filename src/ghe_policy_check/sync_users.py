@@ -1,32 +1,37 @@
 # Copyright (c) 2022, Qualcomm Innovation Center, Inc. All rights reserved.
 # SPDX-License-Identifier: BSD-3-Clause
 
-import math
 from datetime import datetime
+from typing import Optional
 
 from celery.utils.log import get_task_logger
 from django.conf import settings
 from django.db.models import F, QuerySet
 from django.utils import timezone
 
-from ghe_policy_check.common.github_api.github_instance import GithubNotFoundException
+from ghe_policy_check.common.github_api.types import GitHubUser
 from ghe_policy_check.configuration import GHEPolicyCheckConfiguration  # type: ignore
+from ghe_policy_check.models import invalidate_github_id_cache
+from ghe_policy_check.utils import get_github_instance, get_polling_batch_size
 
 logger = get_task_logger(__name__)
 
+BATCH_SIZE = 500
 
-def _update_user(local_user: GHEPolicyCheckConfiguration.User, last_synced: datetime) -> None:
+
+def _update_user(
+    local_user: GHEPolicyCheckConfiguration.User,
+    github_user: Optional[GitHubUser],
+    last_synced: datetime,
+) -> bool:
     logger.info("Syncing user: %s", local_user.username)
     local_user.last_synced = last_synced
 
-    github = GHEPolicyCheckConfiguration.GitHubInstance(settings.GITHUB_ADMIN_TOKENS)
-    try:
-        github_user = github.get_user(local_user.username).json()
-    except GithubNotFoundException:
+    if not github_user:
         # Skip users that have been deleted in GH
-        return
+        return False
     local_user.suspended_at = github_user["suspended_at"]
-    local_user.save()
+    return True
 
 
 def _get_polling_users() -> QuerySet[GHEPolicyCheckConfiguration.User]:
@@ -35,10 +40,7 @@ def _get_polling_users() -> QuerySet[GHEPolicyCheckConfiguration.User]:
     ] = GHEPolicyCheckConfiguration.User.objects.order_by(F("last_synced").asc(nulls_first=True))
 
     # Sync users in same time period as repos
-    users_per_polling_period = math.ceil(
-        users.count() / (settings.REMINDER_MINUTES // settings.POLLING_PERIOD_MINUTES)
-    )
-    return users[:users_per_polling_period]
+    return users[: get_polling_batch_size(GHEPolicyCheckConfiguration.User)]
 
 
 def run_sync_users() -> None:
@@ -47,7 +49,19 @@ def run_sync_users() -> None:
     dividing users over each settings.POLLING_PERIOD_MINUTES
     """
     # Cannot utilize /users GHE endpoint since it does not contain suspension information
-    # Need to query for each user individually to get suspension information
+    # The users are looked up in batches with GraphQL to get suspension information
     now = timezone.now()
-    for local_user in _get_polling_users():
-        _update_user(local_user, now)
+    local_users = list(_get_polling_users())
+    github = get_github_instance(settings.GITHUB_ADMIN_TOKENS)
+    github_users = github.get_users_batch([local_user.username for local_user in local_users])
+    updated_users = [
+        local_user
+        for local_user in local_users
+        if _update_user(local_user, github_users.get(local_user.username), now)
+    ]
+    GHEPolicyCheckConfiguration.User.objects.bulk_update(
+        updated_users, ["suspended_at", "last_synced"], batch_size=BATCH_SIZE
+    )
+    # bulk_update doesn't send post_save, so the cached users are dropped here
+    for local_user in updated_users:
+        invalidate_github_id_cache(local_user)
@@ -1,12 +1,15 @@
 # Copyright (c) 2022, Qualcomm Innovation Center, Inc. All rights reserved.
 # SPDX-License-Identifier: BSD-3-Clause
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import List, Optional
 
 import pytz
-from celery import shared_task
+from celery import group, shared_task
 from celery.utils.log import get_task_logger
-from django.db import IntegrityError
+from django.conf import settings
+from django.db import IntegrityError, connection
 from django.utils import timezone
 
 from ghe_policy_check.common.github_api.github_instance import GithubNotFoundException
@@ -14,10 +17,15 @@ from ghe_policy_check.configuration import GHEPolicyCheckConfiguration  # type:
 from ghe_policy_check.repo_polling import GetAndUpdateRepo, GetPollingRepos, RemindRepo
 from ghe_policy_check.sync_repo_collaborators import run_sync_repo_collaborators
 from ghe_policy_check.sync_users import run_sync_users
+from ghe_policy_check.utils import get_org_owner
 
 logger = get_task_logger(__name__)
 
 TIME_FORMAT = "%Y%m%d%H%M%S%f"
+# The default of settings.POLLING_WORKERS. The workers share the rate limit of
+# the admin tokens, which is paced to the requests remaining until it resets,
+# so workers beyond that rate only wait while holding a database connection
+POLLING_WORKERS = 4
 
 
 # Retry for integrity error in the case that the repo is deleted during this task
@@ -81,11 +89,26 @@ def add_membership(team_github_id: int, user_github_id: int) -> None:
 
     team.members.add(user)
 
-    # Add new user to Team's repos since the member webhook is not fired
-    for repo in team.repos.all():
-        repo.collaborators.add(user)
-        repo.save()
-    team.save()
+    # Add new user to Team's repos since the member webhook is not fired,
+    # the memberships are inserted in one statement skipping existing ones
+    collaborators = GHEPolicyCheckConfiguration.Repo._meta.get_field("collaborators")
+    through = collaborators.remote_field.through
+    repo_ids = list(team.repos.values_list("id", flat=True))
+    through.objects.bulk_create(
+        [
+            through(
+                **{
+                    collaborators.m2m_column_name(): repo_id,
+                    collaborators.m2m_reverse_name(): user.pk,
+                }
+            )
+            for repo_id in repo_ids
+        ],
+        ignore_conflicts=True,
+    )
+    # The changed repos and team are marked modified like saving them would
+    GHEPolicyCheckConfiguration.Repo.objects.filter(id__in=repo_ids).update(modified=timezone.now())
+    team.save(update_fields=["modified"])
     logger.info("Successfully added membership '%s' to team '%s'", user.username, team.team_name)
 
 
@@ -103,10 +126,17 @@ def add_org_member(org_github_id: int, user_github_id: int) -> None:
     org = GHEPolicyCheckConfiguration.Org.objects.get(github_id=org_github_id)
     user = GHEPolicyCheckConfiguration.User.objects.get(github_id=user_github_id)
     org.members.add(user)
-    org.save()
-
-    for repo in org.repos.all():
-        sync_repo_collaborators(repo)
+    org.save(update_fields=["modified"])
+
+    # The syncs are published to the broker together as a group, disabled repos
+    # are skipped since their collaborators can't be read
+    sent = datetime.now(tz=pytz.UTC).strftime(TIME_FORMAT)
+    github_ids = (
+        org.repos.filter(disabled=False)
+        .values_list("github_id", flat=True)
+        .iterator(chunk_size=500)
+    )
+    group(sync_repo_collaborators_task.s(github_id, sent) for github_id in github_ids).apply_async()
 
     logger.info("Successfully added member '%s' to org '%s'", user.username, org.org_name)
 
@@ -126,15 +156,48 @@ def repo_polling() -> None:
     updates all repos and checks to see which repos should be reminded
     """
     now = timezone.now()
-    for local_repo in GetPollingRepos.get_polling_repos():
-        logger.info("Syncing repo %s", local_repo.repo_name)
-
-        # Must call is_reminder_candidate before get_and_update_repo updates
-        # the last_polling_check timestamp
-        needs_reminder = local_repo.is_reminder_candidate
-        github_repo = GetAndUpdateRepo.get_and_update_repo(local_repo, now)
-        if not github_repo:
-            logger.info("Error Updating repo %s", local_repo)
-            continue
-        if needs_reminder:
-            RemindRepo.remind_repo(local_repo, github_repo)
+    # Org owners are looked up at most once per org in every polling period
+    get_org_owner.cache_clear()
+    local_repos = list(GetPollingRepos.get_polling_repos())
+    # Polling is bound by the GitHub round trips, so the repos are split between
+    # workers that poll them concurrently
+    worker_count = getattr(settings, "POLLING_WORKERS", POLLING_WORKERS)
+    with ThreadPoolExecutor(max_workers=worker_count) as executor:
+        workers = [
+            executor.submit(_poll_repos, local_repos[worker::worker_count], now)
+            for worker in range(worker_count)
+        ]
+    # Every worker has finished, the first error of the workers is raised
+    for worker in workers:
+        worker.result()
+
+
+def _poll_repos(local_repos: List[GHEPolicyCheckConfiguration.Repo], now: datetime) -> None:
+    # Each worker thread opens its own database connection, which is closed
+    # once the worker has polled all of its repos
+    error: Optional[Exception] = None
+    try:
+        for local_repo in local_repos:
+            try:
+                _poll_repo(local_repo, now)
+            except Exception as e:  # pylint: disable=broad-except
+                # The rest of the repos are still polled before the error is raised
+                error = error or e
+    finally:
+        connection.close()
+    if error:
+        raise error
+
+
+def _poll_repo(local_repo: GHEPolicyCheckConfiguration.Repo, now: datetime) -> None:
+    logger.info("Syncing repo %s", local_repo.repo_name)
+
+    # Must call is_reminder_candidate before get_and_update_repo updates
+    # the last_polling_check timestamp
+    needs_reminder = local_repo.is_reminder_candidate
+    github_repo = GetAndUpdateRepo.get_and_update_repo(local_repo, now)
+    if not github_repo:
+        logger.info("Error Updating repo %s", local_repo)
+        return
+    if needs_reminder:
+        RemindRepo.remind_repo(local_repo, github_repo)
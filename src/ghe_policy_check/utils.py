@@ -1,23 +1,69 @@
 # Copyright (c) 2022, Qualcomm Innovation Center, Inc. All rights reserved.
 # SPDX-License-Identifier: BSD-3-Clause
 
-from typing import Any, List, Optional
+import threading
+from functools import lru_cache
+from typing import Any, List, Optional, Sequence, Type
 
 from celery.utils.log import get_task_logger
 from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Model
 
 from ghe_policy_check.common.github_api.types import GitHubRepo
 from ghe_policy_check.configuration import GHEPolicyCheckConfiguration  # type: ignore
 
 TIME_FORMAT = "%Y%m%d%H%M%S%f"
+COUNT_CACHE_SECONDS = 60 * 60
+# Like the Repo.Classification choices, the classifications are fixed at import
+_CLASSIFICATIONS = frozenset(classification[1] for classification in settings.CLASSIFICATIONS)
 
 logger = get_task_logger(__name__)
+_THREAD_LOCAL = threading.local()
 
 
 class GithubOwnerDoesNotExistError(Exception):
     pass
 
 
+def get_github_instance(tokens: Sequence[str]) -> GHEPolicyCheckConfiguration.GitHubInstance:
+    """
+    Returns the configured GitHub instance for the given tokens. Each thread gets
+    its own instance, since requests sessions are not thread safe, which is reused
+    so its session, retry adapters and connections are kept alive between calls
+
+    :param tokens: The API tokens used to access the GitHub API
+    :return: The GitHub instance of the current thread
+    """
+    instances = getattr(_THREAD_LOCAL, "github_instances", None)
+    if instances is None:
+        instances = _THREAD_LOCAL.github_instances = {}
+    key = (GHEPolicyCheckConfiguration.GitHubInstance, tuple(tokens))
+    github = instances.get(key)
+    if github is None:
+        github = instances[key] = GHEPolicyCheckConfiguration.GitHubInstance(list(tokens))
+    return github
+
+
+def get_polling_batch_size(model: Type[Model]) -> int:
+    """
+    Gets the number of rows of a model to poll every settings.POLLING_PERIOD_MINUTES
+    so that every row is polled once every settings.REMINDER_MINUTES. The row
+    count is cached for an hour instead of counting the table every polling period
+
+    :param model: The model being polled
+    :return: The number of rows to poll in a single polling period
+    """
+    count: int = cache.get_or_set(
+        f"ghe_policy_check:count:{model._meta.label_lower}",
+        model.objects.count,
+        COUNT_CACHE_SECONDS,
+    )
+    polling_periods: int = settings.REMINDER_MINUTES // settings.POLLING_PERIOD_MINUTES
+    # Integer ceiling division, exact for any count unlike rounding a float quotient
+    return -(-count // polling_periods)
+
+
 def get_email(repo: GitHubRepo) -> Any:
     """
     Gets the email for a repo by checking if its owner (Org or User) has its
@@ -27,7 +73,7 @@ def get_email(repo: GitHubRepo) -> Any:
         email of
     :return: The email of the repo, if it has one
     """
-    github = GHEPolicyCheckConfiguration.GitHubInstance(settings.GITHUB_ADMIN_TOKENS)
+    github = get_github_instance(settings.GITHUB_ADMIN_TOKENS)
     owner = repo["owner"]["login"]
     if repo["owner"]["type"] == "User":
         email = github.get_user(owner).json()["email"]
@@ -44,25 +90,24 @@ def get_classification(topics: List[str]) -> Optional[str]:
     :return: The classification of the repo if it is in the topic list,
     otherwise None.
     """
-    classifications = {classification[1] for classification in settings.CLASSIFICATIONS}
-    for topic in topics:
-        if topic in classifications:
-            return topic
-    return None
+    return next((topic for topic in topics if topic in _CLASSIFICATIONS), None)
 
 
 # Gets the first admin returned from GH that is not the GH admin
 # If no such user exists returns the GH admin
+@lru_cache(maxsize=256)
 def get_org_owner(org: str) -> GHEPolicyCheckConfiguration.User:
     """
     For a given GitHub Org, retrieve its owner. The owner will be the first
     admin that is encountered that is not the Global GitHub Owner Admin
     that is specified by settings.GITHUB_OWNER_USER. If there are no other
-    admins of that org the the Gloval GitHub Owner Admin will be returned
+    admins of that org the the Gloval GitHub Owner Admin will be returned.
+    The owners are cached until ``get_org_owner.cache_clear()`` is called,
+    which repo polling does at the start of every polling period
     :param org: The org to get the admin of
     :return: The Owner of the provided org
     """
-    github = GHEPolicyCheckConfiguration.GitHubInstance([settings.GITHUB_OWNER_TOKEN])
+    github = get_github_instance([settings.GITHUB_OWNER_TOKEN])
     owners = github.get_org_admins(org)
     for github_owner in owners:
         username = github_owner["login"]
@@ -88,7 +133,7 @@ def get_github_repo(local_repo: GHEPolicyCheckConfiguration.Repo) -> GitHubRepo:
     :return: The GitHub Repo
     :rtype: :class:`ghe_policy_check.common.github_api.types.GitHubRepo`
     """
-    github = GHEPolicyCheckConfiguration.GitHubInstance(settings.GITHUB_ADMIN_TOKENS)
+    github = get_github_instance(settings.GITHUB_ADMIN_TOKENS)
     with github.impersonate_user(local_repo.owner.username) as impersonated_gh:
         github_repo: GitHubRepo = impersonated_gh.get_repo_by_id(local_repo.github_id).json()
     return github_repo
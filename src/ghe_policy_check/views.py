@@ -6,7 +6,9 @@ from typing import Sequence, Type
 
 from django.http import HttpRequest, HttpResponse, JsonResponse
 from django.middleware.csrf import get_token
+from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.vary import vary_on_cookie
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.filters import OrderingFilter
@@ -19,7 +21,11 @@ from ghe_policy_check.common.github_api.webhook_dispatcher import dispatch_webho
 from ghe_policy_check.configuration import GHEPolicyCheckConfiguration  # type: ignore
 
 
+# The token stays valid for as long as the CSRF cookie it was made from, so
+# browsers can reuse the response until the cookie changes
 @csrf_exempt
+@cache_control(private=True, max_age=60)
+@vary_on_cookie
 def csrf(request: HttpRequest) -> JsonResponse:
     return JsonResponse({"csrfToken": get_token(request)})
 
@@ -33,8 +39,10 @@ class Webhooks(APIView):
         return dispatch_webhook(request)
 
 
+# The serializers read foreign keys from their id columns, only the many to many
+# relations are queried for each row and have to be prefetched
 class RepoViewSet(ReadOnlyModelViewSet):
-    queryset = GHEPolicyCheckConfiguration.Repo.objects.all()
+    queryset = GHEPolicyCheckConfiguration.Repo.objects.prefetch_related("collaborators", "teams")
     serializer_class = GHEPolicyCheckConfiguration.RepoSerializer
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = {
@@ -68,7 +76,7 @@ class UserViewSet(ReadOnlyModelViewSet):
 
 
 class OrgViewSet(ReadOnlyModelViewSet):
-    queryset = GHEPolicyCheckConfiguration.Org.objects.all()
+    queryset = GHEPolicyCheckConfiguration.Org.objects.prefetch_related("members")
     serializer_class = GHEPolicyCheckConfiguration.OrgSerializer
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ["org_name", "github_id", "owner__github_id"]
@@ -77,7 +85,7 @@ class OrgViewSet(ReadOnlyModelViewSet):
 
 
 class TeamViewSet(ReadOnlyModelViewSet):
-    queryset = GHEPolicyCheckConfiguration.Team.objects.all()
+    queryset = GHEPolicyCheckConfiguration.Team.objects.prefetch_related("members")
     serializer_class = GHEPolicyCheckConfiguration.TeamSerializer
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ["team_name", "team_slug", "github_id"]
@@ -1,9 +1,13 @@
 # Copyright (c) 2022, Qualcomm Innovation Center, Inc. All rights reserved.
 # SPDX-License-Identifier: BSD-3-Clause
 
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
 from unittest import TestCase
+from unittest.mock import Mock, patch
 
-from ghe_policy_check.utils import get_classification
+from ghe_policy_check.configuration import GHEPolicyCheckConfiguration
+from ghe_policy_check.utils import get_classification, get_email, get_github_instance
 
 
 class TasksTestCase(TestCase):
@@ -13,3 +17,40 @@ class TasksTestCase(TestCase):
         self.assertEqual("high", get_classification(["high", "medium"]))
         self.assertIsNone(get_classification(["not-a-class"]))
         self.assertIsNone(get_classification(["HIGH"]))
+
+
+class UtilsTestCase(TestCase):
+    def setUp(self):
+        self.mock_instance = Mock()
+        patcher = patch.object(
+            GHEPolicyCheckConfiguration, "GitHubInstance", Mock(return_value=self.mock_instance)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_email_user(self):
+        self.mock_instance.get_user.return_value = SimpleNamespace(
+            json=lambda: {"email": "user@test.com"}
+        )
+        repo = {"owner": {"login": "testowner", "type": "User"}}
+
+        self.assertEqual(get_email(repo), "user@test.com")
+        self.mock_instance.get_user.assert_called_once_with("testowner")
+
+    def test_get_email_org(self):
+        self.mock_instance.get_org.return_value = SimpleNamespace(
+            json=lambda: {"email": "org@test.com"}
+        )
+        repo = {"owner": {"login": "test-org-1", "type": "Organization"}}
+
+        self.assertEqual(get_email(repo), "org@test.com")
+        self.mock_instance.get_org.assert_called_once_with("test-org-1")
+
+    def test_get_github_instance_per_thread(self):
+        github_instance_class = Mock(side_effect=lambda tokens: Mock())
+        with patch.object(GHEPolicyCheckConfiguration, "GitHubInstance", github_instance_class):
+            github = get_github_instance(["token"])
+
+            self.assertIs(get_github_instance(["token"]), github)
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                self.assertIsNot(executor.submit(get_github_instance, ["token"]).result(), github)
@@ -2,64 +2,103 @@
 # SPDX-License-Identifier: BSD-3-Clause
 
 # pylint: disable=no-self-use,unused-argument
-import json
-
 from django.contrib.auth import models as auth_models
 from django.test import TestCase
 from rest_framework.status import HTTP_200_OK
-from rest_framework.test import APIClient
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
 
 from ghe_policy_check.models import BasicOrg, BasicRepo, BasicTeam, BasicUser
+from ghe_policy_check.views import OrgViewSet, RepoViewSet, TeamViewSet, UserViewSet
+
+REPO_LIST = RepoViewSet.as_view({"get": "list"})
+USER_LIST = UserViewSet.as_view({"get": "list"})
+ORG_LIST = OrgViewSet.as_view({"get": "list"})
+TEAM_LIST = TeamViewSet.as_view({"get": "list"})
 
 
 def _get_data(response):
-    return json.loads(response.content.decode("utf-8"))["data"]
+    return response.data["data"]
 
 
 class RestApiTestCase(TestCase):
     fixtures = ["test_data"]
 
+    @classmethod
+    def setUpTestData(cls):
+        # force_authenticate only needs a user object, so it is never saved
+        cls.user = auth_models.User(username="fakeuser")
+        cls.expected_repo_count = BasicRepo.objects.count()
+        cls.expected_repo_size0_count = BasicRepo.objects.filter(size=0).count()
+        cls.expected_user_count = BasicUser.objects.count()
+        cls.expected_org_count = BasicOrg.objects.count()
+        cls.expected_team_count = BasicTeam.objects.count()
+        cls.api_client = APIClient()
+        cls.api_client.force_authenticate(cls.user)
+        cls.factory = APIRequestFactory()
+
     def setUp(self):
-        self.client = APIClient()
-        self.user = auth_models.User.objects.create(username="fakeuser")
-        self.client.force_authenticate(self.user)
+        self.client = self.api_client
+        self.client.cookies.clear()
+
+    def _list(self, view, path, params=None):
+        # Calls the list view directly, skipping the middleware and URL resolution
+        request = self.factory.get(path, params)
+        force_authenticate(request, user=self.user)
+        return view(request)
+
+    def test_csrf_get(self):
+        response = self.client.get("/csrf/")
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertIn("csrfToken", response.json())
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("max-age=60", response["Cache-Control"])
+        self.assertIn("Cookie", response["Vary"])
 
     def test_repo_get(self):
-        response = self.client.get("/api/v1/repos/")
+        with self.assertNumQueries(3):
+            response = self._list(REPO_LIST, "/api/v1/repos/")
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        self.assertEqual(len(response.data), self.expected_repo_count)
+
+    def test_repo_get_prefetches_relations(self):
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/v1/repos/")
         self.assertEqual(response.status_code, HTTP_200_OK)
-        self.assertEqual(len(response.data), len(BasicRepo.objects.all()))
 
     def test_repo_get_filter_size(self):
-        response = self.client.get("/api/v1/repos/", {"size": 0})
+        response = self._list(REPO_LIST, "/api/v1/repos/", {"size": 0})
         self.assertEqual(response.status_code, HTTP_200_OK)
-        self.assertEqual(len(response.data), len(BasicRepo.objects.filter(size=0)))
+        self.assertEqual(len(response.data), self.expected_repo_size0_count)
 
     def test_user_get(self):
-        response = self.client.get("/api/v1/users/")
+        with self.assertNumQueries(1):
+            response = self._list(USER_LIST, "/api/v1/users/")
         self.assertEqual(response.status_code, HTTP_200_OK)
-        self.assertEqual(len(response.data), len(BasicUser.objects.all()))
+        self.assertEqual(len(response.data), self.expected_user_count)
 
     def test_user_get_filter_github_id(self):
-        response = self.client.get("/api/v1/users/", {"github_id": 1})
+        response = self._list(USER_LIST, "/api/v1/users/", {"github_id": 1})
         self.assertEqual(response.status_code, HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
 
     def test_org_get(self):
-        response = self.client.get("/api/v1/orgs/")
+        with self.assertNumQueries(2):
+            response = self._list(ORG_LIST, "/api/v1/orgs/")
         self.assertEqual(response.status_code, HTTP_200_OK)
-        self.assertEqual(len(response.data), len(BasicOrg.objects.all()))
+        self.assertEqual(len(response.data), self.expected_org_count)
 
     def test_org_get_filter_org_name(self):
-        response = self.client.get("/api/v1/orgs/", {"org_name": "test-org-2"})
+        response = self._list(ORG_LIST, "/api/v1/orgs/", {"org_name": "test-org-2"})
         self.assertEqual(response.status_code, HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
 
     def test_team_get(self):
-        response = self.client.get("/api/v1/teams/")
+        with self.assertNumQueries(2):
+            response = self._list(TEAM_LIST, "/api/v1/teams/")
         self.assertEqual(response.status_code, HTTP_200_OK)
-        self.assertEqual(len(response.data), len(BasicTeam.objects.all()))
+        self.assertEqual(len(response.data), self.expected_team_count)
 
     def test_team_get_filter_team_name(self):
-        response = self.client.get("/api/v1/teams/", {"team_name": "team 1"})
+        response = self._list(TEAM_LIST, "/api/v1/teams/", {"team_name": "team 1"})
         self.assertEqual(response.status_code, HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
@@ -1,6 +1,7 @@
 # Copyright (c) 2022, Qualcomm Innovation Center, Inc. All rights reserved.
 # SPDX-License-Identifier: BSD-3-Clause
 from unittest import TestCase
+from unittest.mock import patch
 
 from ghe_policy_check.configuration import ConfigurationError, GHEPolicyCheckConfiguration
 from ghe_policy_check.models import BasicOrg, BasicRepo, BasicTeam, BasicUser
@@ -23,9 +24,11 @@ class ConfigurationTestCase(TestCase):
         self.assertEqual(GHEPolicyCheckConfiguration.Team, BasicTeam)
 
     def test_configure_models_abstract(self):
-        BasicRepo.Meta.abstract = True
-        with self.assertRaisesRegex(ConfigurationError, "abstract"):
-            GHEPolicyCheckConfiguration.configure_models(BasicRepo, BasicOrg, BasicUser, BasicTeam)
+        with patch.object(BasicRepo.Meta, "abstract", True):
+            with self.assertRaisesRegex(ConfigurationError, "abstract"):
+                GHEPolicyCheckConfiguration.configure_models(
+                    BasicRepo, BasicOrg, BasicUser, BasicTeam
+                )
 
     def test_configure_models_subclass(self):
         class FakeRepo:
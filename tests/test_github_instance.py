@@ -2,6 +2,10 @@
 # SPDX-License-Identifier: BSD-3-Clause
 
 # pylint: disable=no-self-use,unused-argument, too-many-public-methods
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+from types import SimpleNamespace
 from unittest import TestCase
 from unittest.mock import Mock, call, patch
 
@@ -13,28 +17,32 @@ from ghe_policy_check.common.github_api.github_instance import (
     GithubAccountSuspendedException,
     GithubBadCredentialsException,
     GithubClientException,
+    GithubException,
     GitHubInstance,
     GithubNotFoundException,
     GithubRepositoryBlockedException,
     InvalidImpersonationError,
     RateLimitException,
+    TokenBucket,
 )
 
 
 class GitHubInstanceTestCase(TestCase):
     def setUp(self):
-        self.get_items = [Mock(), Mock()]
+        # The rate limit buckets are shared by every instance in the process
+        patcher = patch.dict(github_instance._RATE_LIMITS, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.get_items = [object(), object()]
         ret_val = Mock(name="ret val", json=lambda: self.get_items)
-        mock_get = Mock(name="mock get", return_value=ret_val)
-        mock_post = Mock(name="mock post", return_val=Mock())
-        mock_put = Mock(name="mock put", return_val=Mock())
-        mock_delete = Mock(name="mock delete", return_val=Mock())
-
         self.github = github_instance.GitHubInstance(["token"], "fakeurl.com")
-        self.github.get = mock_get
-        self.github.put = mock_put
-        self.github.post = mock_post
-        self.github.delete = mock_delete
+        self.github.get = Mock(name="mock get", return_value=ret_val)
+
+    def _mock_writes(self):
+        # Only the tests that send writes need the put, post and delete mocks
+        self.github.put = Mock(name="mock put")
+        self.github.post = Mock(name="mock post")
+        self.github.delete = Mock(name="mock delete")
 
     def test_no_github_tokens(self):
         with self.assertRaises(ValueError):
@@ -56,170 +64,515 @@ class GitHubInstanceTestCase(TestCase):
             "https://github-test.com/api/v3/organizations?since=13",
         )
 
+    def test_get_next_url_link_header_with_comma_in_url(self):
+        link_header = (
+            '<https://github-test.com/api/v3/search/repositories?q=a,b&page=1>; rel="prev", '
+            '<https://github-test.com/api/v3/search/repositories?q=a,b&page=3>; rel="next"'
+        )
+        self.assertEqual(
+            GitHubInstance.get_next_url(Mock(headers={"Link": link_header})),
+            "https://github-test.com/api/v3/search/repositories?q=a,b&page=3",
+        )
+
     def test_get_next_url_link_header_without_next(self):
         link_header = '<https://github-test.com/api/v3/organizations{?since}>; rel="first"'
         mock_request = Mock(headers={"Link": link_header})
         self.assertIsNone(github_instance.GitHubInstance.get_next_url(mock_request))
 
     @patch("ghe_policy_check.common.github_api.github_instance.sleep")
-    def test_handle_rate_limit_exception_rotate_token(self, m_sleep):
+    def test_handle_rate_limit_exception(self, m_sleep):
         github = GitHubInstance(["token1", "token2"], "fakeurl.com")
-
-        ret_val = Mock()
-        github.request = Mock(return_value=ret_val)
         github.rotate_token = Mock()
-        mock_http_verb = Mock(return_val=Mock())
-        fake_url = "test.url.com2"
-        self.assertEqual(github._handle_rate_limit_exception(mock_http_verb, fake_url, 0), ret_val)
-
-        m_sleep.assert_not_called()
-        github.request.assert_called_once_with(mock_http_verb, fake_url, 1)
-        github.rotate_token.assert_called_once()
-
+        github.get_rate_limit_reset = Mock()
+        response = SimpleNamespace(headers={"X-RateLimit-Reset": "0"})
+        cases = [
+            # retry, expect_sleep, expect_raise
+            (0, False, False),
+            (1, True, False),
+            (100, False, True),
+        ]
+        for retry, expect_sleep, expect_raise in cases:
+            with self.subTest(retry=retry):
+                m_sleep.reset_mock()
+
+                if expect_raise:
+                    with self.assertRaisesRegex(Exception, "Rate limit retries failed"):
+                        github._handle_rate_limit_exception(retry, response)
+                else:
+                    github._handle_rate_limit_exception(retry, response)
+
+                self.assertEqual(m_sleep.called, expect_sleep)
+                # The next token is picked by the request, and the reset is read
+                # from the rate limited response instead of another token
+                github.rotate_token.assert_not_called()
+                github.get_rate_limit_reset.assert_not_called()
+
+    @patch("ghe_policy_check.common.github_api.github_instance.time")
     @patch("ghe_policy_check.common.github_api.github_instance.sleep")
-    def test_handle_rate_limit_exception_sleep(self, m_sleep):
-        github = GitHubInstance(["token1", "token2"], "fakeurl.com")
+    def test_handle_rate_limit_exception_sleep_jitter(self, m_sleep, m_time):
+        m_time.return_value = 100
 
-        ret_val = Mock()
-        github.request = Mock(return_value=ret_val)
+        self.github._handle_rate_limit_exception(
+            1, SimpleNamespace(headers={"X-RateLimit-Reset": "110"})
+        )
 
-        m_get_rate_limit_reset = Mock(return_value=0)
-        github.get_rate_limit_reset = m_get_rate_limit_reset
+        wait = m_sleep.call_args[0][0]
+        self.assertGreaterEqual(wait, 10 + GitHubInstance.RETRY_BACKOFF_BASE)
+        self.assertLessEqual(wait, 10 + 3 * GitHubInstance.RETRY_BACKOFF_BASE)
 
-        mock_http_verb = Mock()
-        fake_url = "test.url.com"
+    def test_next_backoff_capped(self):
+        for _ in range(20):
+            backoff = self.github._next_backoff()
+            self.assertGreaterEqual(backoff, GitHubInstance.RETRY_BACKOFF_BASE)
+            self.assertLessEqual(backoff, GitHubInstance.RETRY_BACKOFF_CAP)
 
-        self.assertEqual(github._handle_rate_limit_exception(mock_http_verb, fake_url, 1), ret_val)
+    @patch("ghe_policy_check.common.github_api.github_instance.sleep")
+    @patch("ghe_policy_check.common.github_api.github_instance.GitHubInstance.handle_error")
+    def test_request_resets_backoff(self, m_handle_error, m_sleep):
+        response = Mock(headers={"X-RateLimit-Reset": "0"})
+        self.github._session.request = Mock(return_value=response)
+        m_handle_error.side_effect = [RateLimitException, None]
+        self.github._backoff = GitHubInstance.RETRY_BACKOFF_CAP
 
-        m_sleep.assert_called_once()
-        github.request.assert_called_once_with(mock_http_verb, fake_url, 2)
+        self.github.request("GET", "test.url.com")
 
-    @patch("ghe_policy_check.common.github_api.github_instance.sleep")
-    def test_handle_rate_limit_exception_retry_exceeded(self, m_sleep):
-        mock_http_verb = Mock(return_val=Mock(), __name__="test")
-        fake_url = "test.url.com2"
-        with self.assertRaisesRegex(Exception, "Rate limit retries failed"):
-            self.github._handle_rate_limit_exception(mock_http_verb, fake_url, 100)
+        m_sleep.assert_called_once()
+        self.assertEqual(self.github._backoff, GitHubInstance.RETRY_BACKOFF_BASE)
 
-        m_sleep.assert_not_called()
+    def test_session_retries_server_errors(self):
+        retries = self.github._session.get_adapter("https://fakeurl.com").max_retries
+        self.assertEqual(retries.total, 5)
+        self.assertEqual(set(retries.status_forcelist), {500, 502, 503, 504})
+        self.assertFalse(retries.raise_on_status)
 
     @patch("ghe_policy_check.common.github_api.github_instance.GitHubInstance.handle_error")
     def test_request(self, m_handle_error):
-        response = Mock()
-        mock_http_verb = Mock(return_value=response, __name__="test")
+        response = Mock(headers={})
+        self.github._session.request = Mock(return_value=response)
         fake_url = "test.url.com"
-        self.assertEqual(self.github.request(mock_http_verb, fake_url), response)
+        self.assertEqual(self.github.request("GET", fake_url), response)
         m_handle_error.assert_called_once_with(response)
+        self.github._session.request.assert_called_once_with(
+            "GET", fake_url, headers={"Authorization": "Bearer token"}
+        )
 
     @patch("ghe_policy_check.common.github_api.github_instance.GitHubInstance.handle_error")
     def test_request_rate_limit_exception(self, m_handle_error):
-        response = Mock()
-        mock_http_verb = Mock(return_value=response, __name__="test")
+        response = Mock(headers={"Retry-After": "60"})
+        self.github._session.request = Mock(return_value=response)
         fake_url = "test.url.com"
-        m_handle_error.side_effect = RateLimitException
-        self.github._handle_rate_limit_exception = Mock(return_value=Mock())
-        self.assertEqual(
-            self.github.request(mock_http_verb, fake_url),
-            self.github._handle_rate_limit_exception.return_value,
+        m_handle_error.side_effect = [RateLimitException, None]
+        self.github._handle_rate_limit_exception = Mock()
+        self.assertEqual(self.github.request("PUT", fake_url, json={"names": []}), response)
+        m_handle_error.assert_has_calls([call(response)] * 2)
+        self.github._handle_rate_limit_exception.assert_called_once_with(0, response)
+        # The retry is made with the same request arguments
+        self.github._session.request.assert_has_calls(
+            [
+                call(
+                    "PUT",
+                    fake_url,
+                    headers={"Authorization": "Bearer token"},
+                    json={"names": []},
+                )
+            ]
+            * 2
         )
-        m_handle_error.assert_called_once_with(response)
-        self.github._handle_rate_limit_exception.assert_called_once_with(
-            mock_http_verb, fake_url, 0
+
+    @patch("ghe_policy_check.common.github_api.github_instance.GitHubInstance.handle_error")
+    def test_request_rate_limit_attempts_ignore_retry(self, m_handle_error):
+        response = Mock(headers={})
+        self.github._session.request = Mock(return_value=response)
+        m_handle_error.side_effect = [RateLimitException, RateLimitException, None]
+        self.github._handle_rate_limit_exception = Mock()
+
+        self.github.request("GET", "test.url.com", retry=5)
+
+        self.github._handle_rate_limit_exception.assert_has_calls(
+            [call(0, response), call(1, response)]
         )
 
+    @patch("ghe_policy_check.common.github_api.github_instance.sleep")
+    def test_handle_rate_limit_exception_retry_after(self, m_sleep):
+        github = GitHubInstance(["token1", "token2"], "fakeurl.com")
+
+        github.rotate_token = Mock()
+        github._handle_rate_limit_exception(0, SimpleNamespace(headers={"Retry-After": "30"}))
+
+        m_sleep.assert_called_once_with(30)
+        github.rotate_token.assert_not_called()
+
+    @patch("ghe_policy_check.common.github_api.github_instance.GitHubInstance.handle_error")
+    def test_request_updates_rate_limit(self, m_handle_error):
+        reset = int(time()) + 100
+        response = Mock(headers={"X-RateLimit-Remaining": "50", "X-RateLimit-Reset": str(reset)})
+        self.github._session.request = Mock(return_value=response)
+        self.github.request("GET", "test.url.com")
+
+        bucket = github_instance._RATE_LIMITS["token"]
+        self.assertEqual(bucket.capacity, GitHubInstance.RATE_LIMIT_BURST)
+        self.assertEqual(bucket.tokens, 50)
+        self.assertAlmostEqual(bucket.refill_rate, 0.5, places=1)
+
+    @patch("ghe_policy_check.common.github_api.github_instance.GitHubInstance.handle_error")
+    def test_request_ignores_graphql_rate_limit(self, m_handle_error):
+        response = Mock(
+            headers={
+                "X-RateLimit-Remaining": "50",
+                "X-RateLimit-Reset": str(int(time()) + 100),
+                "X-RateLimit-Resource": "graphql",
+            }
+        )
+        self.github._session.request = Mock(return_value=response)
+        self.github.request("POST", "test.url.com")
+
+        self.assertNotIn("token", github_instance._RATE_LIMITS)
+
+    @patch("ghe_policy_check.common.github_api.github_instance.sleep")
+    def test_token_bucket_acquire(self, m_sleep):
+        bucket = TokenBucket(capacity=2, refill_rate=0.5)
+        bucket.acquire()
+        bucket.acquire()
+        m_sleep.assert_not_called()
+        bucket.acquire()
+        m_sleep.assert_called_once()
+        self.assertAlmostEqual(m_sleep.call_args[0][0], 2, places=1)
+
+    def test_token_bucket_update(self):
+        bucket = TokenBucket(capacity=100, refill_rate=0)
+        bucket.update(remaining=10, reset=int(time()) + 20)
+        self.assertEqual(bucket.tokens, 10)
+        self.assertAlmostEqual(bucket.refill_rate, 0.5, places=1)
+
     @patch("ghe_policy_check.common.github_api.github_instance.GitHubInstance.handle_error")
     def test_request_bad_credentials_exception(self, m_handle_error):
-        response = Mock()
-        mock_http_verb = Mock(return_value=response, __name__="test")
+        response = Mock(headers={})
+        self.github._session.request = Mock(return_value=response)
         fake_url = "test.url.com"
         m_handle_error.side_effect = [GithubBadCredentialsException, None]
-        self.github.get_impersonation_token = Mock(return_value="token")
-        self.github.impersonating = "test"
-        self.assertEqual(self.github.request(mock_http_verb, fake_url), response)
+        self.github._on_bad_credentials = Mock(return_value="new-token")
+        self.assertEqual(self.github.request("GET", fake_url), response)
         m_handle_error.assert_has_calls([call(response)] * 2)
-        mock_http_verb.assert_has_calls([call(fake_url, headers=self.github.headers)] * 2)
-        self.github.get_impersonation_token.assert_called_once_with(self.github.impersonating)
-        self.assertEqual(self.github.tokens, ["token"])
-        self.assertEqual(self.github.headers["Authorization"], "Bearer token")
+        self.github._session.request.assert_has_calls(
+            [
+                call("GET", fake_url, headers={"Authorization": "Bearer token"}),
+                call("GET", fake_url, headers={"Authorization": "Bearer new-token"}),
+            ]
+        )
+        self.github._on_bad_credentials.assert_called_once_with()
+        self.assertEqual(self.github.tokens, ["new-token"])
+
+    @patch("ghe_policy_check.common.github_api.github_instance.GitHubInstance.handle_error")
+    def test_request_bad_credentials_exception_after_rate_limit(self, m_handle_error):
+        response = Mock(headers={})
+        self.github._session.request = Mock(return_value=response)
+        m_handle_error.side_effect = [RateLimitException, GithubBadCredentialsException, None]
+        self.github._handle_rate_limit_exception = Mock()
+        self.github._on_bad_credentials = Mock(return_value="new-token")
+
+        self.assertEqual(self.github.request("GET", "test.url.com"), response)
+
+        self.github._on_bad_credentials.assert_called_once_with()
+        self.assertEqual(self.github.tokens, ["new-token"])
 
     @patch("ghe_policy_check.common.github_api.github_instance.GitHubInstance.handle_error")
     def test_request_bad_credentials_exception_retry_fail(self, m_handle_error):
-        response = Mock()
-        mock_http_verb = Mock(return_value=response, __name__="test")
+        response = Mock(headers={})
+        self.github._session.request = Mock(return_value=response)
         fake_url = "test.url.com"
         m_handle_error.side_effect = GithubBadCredentialsException
-        self.github.get_impersonation_token = Mock(return_value="token")
-        self.github.impersonating = "test"
+        self.github._on_bad_credentials = Mock(return_value="new-token")
         with self.assertRaises(GithubBadCredentialsException):
-            self.github.request(mock_http_verb, fake_url)
+            self.github.request("GET", fake_url)
         m_handle_error.assert_has_calls([call(response)] * 2)
-        mock_http_verb.assert_has_calls([call(fake_url, headers=self.github.headers)] * 2)
-        self.github.get_impersonation_token.assert_called_once_with(self.github.impersonating)
-        self.assertEqual(self.github.tokens, ["token"])
-        self.assertEqual(self.github.headers["Authorization"], "Bearer token")
+        self.github._session.request.assert_has_calls(
+            [
+                call("GET", fake_url, headers={"Authorization": "Bearer token"}),
+                call("GET", fake_url, headers={"Authorization": "Bearer new-token"}),
+            ]
+        )
+        self.github._on_bad_credentials.assert_called_once_with()
+        self.assertEqual(self.github.tokens, ["new-token"])
 
     @patch("ghe_policy_check.common.github_api.github_instance.GitHubInstance.handle_error")
     def test_request_bad_credentials_exception_not_impersonating(self, m_handle_error):
-        response = Mock()
-        mock_http_verb = Mock(return_value=response, __name__="test")
+        response = Mock(headers={})
+        self.github._session.request = Mock(return_value=response)
         fake_url = "test.url.com"
         m_handle_error.side_effect = GithubBadCredentialsException
-        self.github.get_impersonation_token = Mock(return_value="token")
         with self.assertRaises(GithubBadCredentialsException):
-            self.github.request(mock_http_verb, fake_url)
+            self.github.request("GET", fake_url)
         m_handle_error.assert_called_once_with(response)
-        mock_http_verb.assert_called_once_with(fake_url, headers=self.github.headers)
-        self.github.get_impersonation_token.assert_not_called()
+        self.github._session.request.assert_called_once_with(
+            "GET", fake_url, headers={"Authorization": "Bearer token"}
+        )
 
-    def test_raise_error_account_suspended(self):
-        error = Mock(response=Mock(json=lambda: {"message": "Sorry. Your account was suspended."}))
-        with self.assertRaises(GithubAccountSuspendedException):
-            GitHubInstance.raise_error(error)
+    def test_request_session_headers(self):
+        github = GitHubInstance(["token1"], "fakeurl.com", headers={"Accept": "fake"})
+        self.assertIs(github.headers, github._session.headers)
+        self.assertEqual(github._session.headers["Accept"], "fake")
+        self.assertNotIn("Authorization", github._session.headers)
 
-    def test_raise_error_repository_access_blocked(self):
-        error = Mock(response=Mock(json=lambda: {"message": "Repository access blocked"}))
-        with self.assertRaises(GithubRepositoryBlockedException):
-            GitHubInstance.raise_error(error)
+    def test_handle_error_ok(self):
+        response = Mock(status_code=codes.not_modified)
+        GitHubInstance.handle_error(response)
+        response.raise_for_status.assert_not_called()
 
-    def test_raise_error_bad_credentials(self):
-        error = Mock(response=Mock(json=lambda: {"message": "Bad credentials"}))
-        with self.assertRaises(GithubBadCredentialsException):
-            GitHubInstance.raise_error(error)
+    def test_handle_error(self):
+        response = Mock(
+            status_code=codes.not_found,
+            raise_for_status=Mock(
+                side_effect=HTTPError(response=Mock(status_code=codes.not_found))
+            ),
+        )
+        with self.assertRaises(GithubNotFoundException):
+            GitHubInstance.handle_error(response)
+
+    def test_raise_error(self):
+        cases = [
+            ("Sorry. Your account was suspended.", 403, GithubAccountSuspendedException),
+            ("Repository access blocked", 451, GithubRepositoryBlockedException),
+            ("Bad credentials", 401, GithubBadCredentialsException),
+            ("API rate limit exceeded", 403, RateLimitException),
+            ("Validation Failed", 422, GithubClientException),
+            ("Not Found", 404, GithubNotFoundException),
+            ("doesn't matter", 500, HTTPError),
+        ]
+        for message, status, exception in cases:
+            with self.subTest(message=message, status=status):
+                error = HTTPError(
+                    response=SimpleNamespace(
+                        status_code=status, json=lambda m=message: {"message": m}
+                    )
+                )
+                with self.assertRaises(exception):
+                    GitHubInstance.raise_error(error)
+
+    def test_get_etag_cache(self):
+        github = GitHubInstance(["token"], "fakeurl.com")
+        cached_response = Mock(status_code=codes.ok, headers={"ETag": '"abc"'})
+        github.request = Mock(
+            side_effect=[cached_response, Mock(status_code=codes.not_modified, headers={})]
+        )
+
+        self.assertEqual(github.get("test.url.com"), cached_response)
+        self.assertEqual(github.get("test.url.com"), cached_response)
+        github.request.assert_has_calls(
+            [
+                call("GET", "test.url.com"),
+                call("GET", "test.url.com", headers={"If-None-Match": '"abc"'}),
+            ]
+        )
+
+    def test_get_etag_cache_modified(self):
+        github = GitHubInstance(["token"], "fakeurl.com")
+        old_response = Mock(status_code=codes.ok, headers={"Last-Modified": "old"})
+        new_response = Mock(status_code=codes.ok, headers={"Last-Modified": "new"})
+        github.request = Mock(side_effect=[old_response, new_response])
+
+        github.get("test.url.com")
+        self.assertEqual(github.get("test.url.com"), new_response)
+        github.request.assert_called_with(
+            "GET", "test.url.com", headers={"If-Modified-Since": "old"}
+        )
+        self.assertEqual(github._etag_cache["test.url.com"], new_response)
+
+    def test_get_etag_cache_no_store(self):
+        github = GitHubInstance(["token"], "fakeurl.com")
+        github.request = Mock(
+            return_value=Mock(
+                status_code=codes.ok, headers={"ETag": '"abc"', "Cache-Control": "no-store"}
+            )
+        )
 
-    def test_raise_error_rate_limit(self):
-        error = Mock(response=Mock(json=lambda: {"message": "rate limit"}))
-        with self.assertRaises(RateLimitException):
-            GitHubInstance.raise_error(error)
+        github.get("test.url.com")
+        github.get("test.url.com")
+        github.request.assert_has_calls([call("GET", "test.url.com")] * 2)
+        self.assertNotIn("test.url.com", github._etag_cache)
 
-    def test_raise_error_client(self):
-        error = Mock(response=Mock(status_code=422))
-        with self.assertRaises(GithubClientException):
-            GitHubInstance.raise_error(error)
+    def test_get_etag_cache_paginated(self):
+        github = GitHubInstance(["token"], "fakeurl.com")
+        github.request = Mock(
+            return_value=Mock(
+                status_code=codes.ok,
+                headers={"ETag": '"abc"', "Link": '<fakeurl.com/users?since=1>; rel="next"'},
+            )
+        )
+
+        github.get("fakeurl.com/users")
+        github.get("fakeurl.com/users")
+        github.request.assert_has_calls([call("GET", "fakeurl.com/users")] * 2)
+        self.assertNotIn("fakeurl.com/users", github._etag_cache)
+
+    @patch("ghe_policy_check.common.github_api.github_instance.GitHubInstance.ETAG_CACHE_SIZE", 1)
+    def test_get_etag_cache_eviction(self):
+        github = GitHubInstance(["token"], "fakeurl.com")
+        github.request = Mock(return_value=Mock(status_code=codes.ok, headers={"ETag": '"abc"'}))
+
+        github.get("test.url.com/1")
+        github.get("test.url.com/2")
+        self.assertEqual(list(github._etag_cache), ["test.url.com/2"])
 
     def test_get_paginated_request(self):
         fake_url = "test.url.com"
         self.github.get_next_url = Mock(return_value=None)
+        self.github.request = Mock(return_value=Mock(content=b'[{"id": 1}, {"id": 2}]'))
 
         resp = self.github.get_paginated_response(fake_url)
-        for index, item in enumerate(resp):
-            self.assertEqual(self.get_items[index], item)
+        self.assertEqual(list(resp), [{"id": 1}, {"id": 2}])
+        # The pages bypass the ETag cache of get()
+        self.github.get.assert_not_called()
+        self.github.request.assert_called_once_with("GET", fake_url + "?per_page=100")
+
+    def test_drain(self):
+        items = [1, 2, 3]
+        drained = GitHubInstance._drain(items)
+        self.assertEqual(next(drained), 1)
+        self.assertEqual(items, [3, 2])
+        self.assertEqual(list(drained), [2, 3])
+        self.assertEqual(items, [])
+
+    def test_get_remaining_page_urls(self):
+        link_header = (
+            '<https://github-test.com/api/v3/orgs/org/repos?per_page=100&page=2>; rel="next", '
+            '<https://github-test.com/api/v3/orgs/org/repos?per_page=100&page=3>; rel="last"'
+        )
+        self.assertEqual(
+            GitHubInstance.get_remaining_page_urls(Mock(headers={"Link": link_header})),
+            [
+                "https://github-test.com/api/v3/orgs/org/repos?per_page=100&page=2",
+                "https://github-test.com/api/v3/orgs/org/repos?per_page=100&page=3",
+            ],
+        )
+
+    def test_get_remaining_page_urls_no_page(self):
+        link_header = '<https://github-test.com/api/v3/organizations?since=13>; rel="next"'
+        self.assertIsNone(
+            GitHubInstance.get_remaining_page_urls(Mock(headers={"Link": link_header}))
+        )
+
+    def test_get_paginated_response_concurrent(self):
+        link_header = (
+            '<https://fakeurl.com/orgs/org/repos?per_page=100&page=2>; rel="next", '
+            '<https://fakeurl.com/orgs/org/repos?per_page=100&page=3>; rel="last"'
+        )
+        pages = {
+            "fakeurl.com/orgs/org/repos?per_page=100": Mock(
+                content=b"[1, 2]", headers={"Link": link_header}
+            ),
+            "https://fakeurl.com/orgs/org/repos?per_page=100&page=2": Mock(content=b"[3, 4]"),
+            "https://fakeurl.com/orgs/org/repos?per_page=100&page=3": Mock(content=b"[5]"),
+        }
+        self.github.request = Mock(side_effect=lambda verb, url: pages[url])
+
+        items = list(self.github.get_paginated_response_concurrent("fakeurl.com/orgs/org/repos"))
+        self.assertEqual(items, [1, 2, 3, 4, 5])
+        self.github.get.assert_not_called()
+
+    def test_get_paginated_response_concurrent_next_links(self):
+        link_header = '<https://fakeurl.com/organizations?since=13>; rel="next"'
+        self.github.request = Mock(
+            side_effect=[
+                Mock(content=b"[1]", headers={"Link": link_header}),
+                Mock(content=b"[2]", headers={}),
+            ]
+        )
+
+        items = list(self.github.get_paginated_response_concurrent("fakeurl.com/organizations"))
+        self.assertEqual(items, [1, 2])
+        self.github.request.assert_called_with("GET", "https://fakeurl.com/organizations?since=13")
 
     def test_get_paginated_search_request(self):
         fake_url = "test.url.com"
         self.github.get_next_url = Mock(return_value=None)
-        self.github.get.return_value = Mock(json=lambda: {"items": self.get_items})
+        self.github.request = Mock(return_value=Mock(content=b'{"items": [{"id": 1}, {"id": 2}]}'))
         resp = self.github.get_paginated_search_response(fake_url)
-        for index, item in enumerate(resp):
-            self.assertEqual(self.get_items[index], item)
+        self.assertEqual(list(resp), [{"id": 1}, {"id": 2}])
+
+    def test_url(self):
+        self.assertEqual(
+            self.github._url(GitHubInstance.Endpoints.REPO_TOPICS, "owner", "repo%20"),
+            "fakeurl.com/repos/owner/repo%20/topics",
+        )
+        self.assertEqual(
+            self.github._url(GitHubInstance.Endpoints.ORGANIZATIONS), "fakeurl.com/organizations"
+        )
 
     def test_rotate_tokens(self):
         tokens = ["token1", "token2"]
         github = github_instance.GitHubInstance(tokens, "fakeurl.com")
-        self.assertTrue(tokens[0] in github.headers["Authorization"])
         github.rotate_token()
-        self.assertTrue("token2" in github.headers["Authorization"])
         self.assertEqual(["token2", "token1"], github.tokens)
 
+    def test_auth_headers_cached(self):
+        headers = self.github._auth_headers("token")
+        self.assertEqual(headers, {"Authorization": "Bearer token"})
+        self.assertIs(self.github._auth_headers("token"), headers)
+
+    def test_next_token_round_robin(self):
+        github = github_instance.GitHubInstance(["token1", "token2", "token3"], "fakeurl.com")
+        self.assertEqual(
+            [github._next_token() for _ in range(4)], ["token1", "token2", "token3", "token1"]
+        )
+
+    def test_next_token_skips_depleted(self):
+        github = github_instance.GitHubInstance(["token1", "token2"], "fakeurl.com")
+        bucket = github_instance._RATE_LIMITS["token1"] = TokenBucket(100, 0)
+        bucket.update(remaining=2, reset=int(time()) + 100)
+        self.assertEqual([github._next_token() for _ in range(2)], ["token2", "token2"])
+
+        bucket.update(remaining=2, reset=int(time()) - 1)
+        self.assertEqual(github._next_token(), "token1")
+
+    @patch("ghe_policy_check.common.github_api.github_instance.GitHubInstance.handle_error")
+    def test_rate_limits_shared_between_instances(self, m_handle_error):
+        github = GitHubInstance(["token1", "token2"], "fakeurl.com")
+        other_github = GitHubInstance(["token1", "token2"], "fakeurl.com")
+        github._session.request = Mock(
+            return_value=Mock(
+                headers={"X-RateLimit-Remaining": "2", "X-RateLimit-Reset": str(int(time()) + 100)}
+            )
+        )
+
+        github.request("GET", "test.url.com")
+        # The other instance skips the token the first instance found nearly depleted
+        self.assertEqual([other_github._next_token() for _ in range(2)], ["token2", "token2"])
+
+    @patch("ghe_policy_check.common.github_api.github_instance.GitHubInstance.handle_error")
+    def test_request_round_robin_tokens(self, m_handle_error):
+        github = github_instance.GitHubInstance(["token1", "token2"], "fakeurl.com")
+        github._session.request = Mock(return_value=Mock(headers={}))
+        github.request("GET", "test.url.com", headers={"If-None-Match": "etag"})
+        github.request("GET", "test.url.com")
+        github._session.request.assert_has_calls(
+            [
+                call(
+                    "GET",
+                    "test.url.com",
+                    headers={"Authorization": "Bearer token1", "If-None-Match": "etag"},
+                ),
+                call("GET", "test.url.com", headers={"Authorization": "Bearer token2"}),
+            ]
+        )
+
+    @patch("ghe_policy_check.common.github_api.github_instance.GitHubInstance.handle_error")
+    def test_request_concurrent_token_rotation(self, m_handle_error):
+        # The pages of a paginated listing are fetched by several threads
+        # through the same instance, each rotating its tokens
+        response = Mock(headers={})
+        self.github._session.request = Mock(return_value=response)
+        # Switching threads as often as possible makes an unlocked rotation fail
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, switch_interval)
+        with ThreadPoolExecutor(max_workers=GitHubInstance.PAGINATION_WORKERS) as executor:
+            futures = [
+                executor.submit(self.github.request, "GET", "test.url.com") for _ in range(2000)
+            ]
+        for future in futures:
+            self.assertIs(future.result(), response)
+        self.assertEqual(self.github.tokens, ["token"])
+
     def test_get_repository_topics(self):
         fake_owner = "fake-owner"
         fake_repo = "fake-repo"
@@ -232,9 +585,10 @@ class GitHubInstanceTestCase(TestCase):
         )
 
     def test_set_repository_topics(self):
+        self._mock_writes()
         fake_owner = "fake-owner"
         fake_repo = "fake-repo"
-        fake_topic = Mock()
+        fake_topic = "fake-topic"
         self.github.set_repository_topics(fake_owner, fake_repo, [fake_topic])
         self.github.put.assert_called_once_with(
             self.github.base_url + f"/repos/{fake_owner}/{fake_repo}/topics",
@@ -242,10 +596,11 @@ class GitHubInstanceTestCase(TestCase):
         )
 
     def test_add_repository_topics(self):
+        self._mock_writes()
         fake_owner = "fake-owner"
         fake_repo = "fake-repo"
-        new_topic = Mock("new topic")
-        old_topic = Mock("old_topic")
+        new_topic = "new-topic"
+        old_topic = "old-topic"
         self.github.get.return_value = Mock(json=lambda: {"names": [old_topic]})
         self.github.add_repository_topics(fake_owner, fake_repo, [new_topic])
         self.github.put.assert_called_with(
@@ -253,77 +608,128 @@ class GitHubInstanceTestCase(TestCase):
             json={"names": [new_topic, old_topic]},
         )
 
+    def test_add_repository_topics_existing_topics(self):
+        self._mock_writes()
+        fake_owner = "fake-owner"
+        fake_repo = "fake-repo"
+        self.github.add_repository_topics(fake_owner, fake_repo, ["new"], ["old"])
+        self.github.get.assert_not_called()
+        self.github.put.assert_called_with(
+            self.github.base_url + f"/repos/{fake_owner}/{fake_repo}/topics",
+            json={"names": ["new", "old"]},
+        )
+
+    def test_graphql(self):
+        github = GitHubInstance(["token"], "https://github-test.com/api/v3")
+        github.post = Mock(return_value=Mock(json=lambda: {"data": {"a0": None}}))
+        self.assertEqual(github.graphql("query { a0: viewer { login } }"), {"a0": None})
+        github.post.assert_called_once_with(
+            "https://github-test.com/api/graphql",
+            json={"query": "query { a0: viewer { login } }", "variables": {}},
+        )
+
+    def test_graphql_error(self):
+        self._mock_writes()
+        self.github.post.return_value = Mock(
+            json=lambda: {"data": None, "errors": [{"message": "Parse error"}]}
+        )
+        with self.assertRaisesRegex(GithubException, "Parse error"):
+            self.github.graphql("query {")
+
+    def test_get_users_batch(self):
+        self.github.graphql = Mock(
+            return_value={
+                "a0": {
+                    "login": "user",
+                    "databaseId": 1,
+                    "name": "User",
+                    "email": "",
+                    "isSiteAdmin": False,
+                    "suspendedAt": "2021-01-30T21:06:30Z",
+                },
+                "a1": None,
+            }
+        )
+        users = self.github.get_users_batch(["user", "missing"])
+        self.assertEqual(
+            users,
+            {
+                "user": {
+                    "login": "user",
+                    "id": 1,
+                    "name": "User",
+                    "email": None,
+                    "site_admin": False,
+                    "suspended_at": "2021-01-30T21:06:30Z",
+                },
+                "missing": None,
+            },
+        )
+        query, variables = self.github.graphql.call_args[0]
+        self.assertIn("query($a0_0: String!, $a1_0: String!)", query)
+        self.assertIn("a1: user(login: $a1_0)", query)
+        self.assertEqual(variables, {"a0_0": "user", "a1_0": "missing"})
+
+    @patch.object(GitHubInstance, "GRAPHQL_BATCH_SIZE", 2)
+    def test_get_users_batch_chunks(self):
+        self.github.graphql = Mock(return_value={})
+        users = self.github.get_users_batch(["a", "b", "c"])
+        self.assertEqual(users, {"a": None, "b": None, "c": None})
+        self.assertEqual(self.github.graphql.call_count, 2)
+
     def test_get_repo_by_id(self):
-        fake_id = Mock()
+        fake_id = 1234
         self.github.get_repo_by_id(fake_id)
         self.github.get.assert_called_once_with(
             self.github.base_url + f"/repositories/{fake_id}",
         )
 
     def test_get_user(self):
-        fake_user_name = Mock()
+        fake_user_name = "fake-user"
         self.github.get_user(fake_user_name)
         self.github.get.assert_called_once_with(
             self.github.base_url + f"/users/{fake_user_name}",
         )
 
-    def test_get_users(self):
-        self.github.get_paginated_response = Mock()
-        self.github.get_users()
-        self.github.get_paginated_response.assert_called_once_with(
-            self.github.base_url + "/users",
-        )
-
-    def test_get_users_since(self):
-        self.github.get_paginated_response = Mock()
-        self.github.get_users(1)
-        self.github.get_paginated_response.assert_called_once_with(
-            self.github.base_url + "/users?since=1",
-        )
+    def test_paginated_urls(self):
+        cases = [
+            ("get_users", (), "/users"),
+            ("get_users", (1,), "/users?since=1"),
+            ("get_organizations", (), "/organizations"),
+            ("get_organizations", (1,), "/organizations?since=1"),
+            ("get_teams", ("team",), "/orgs/team/teams"),
+            ("get_team_repos", ("org-id", "team-id"), "/organizations/org-id/team/team-id/repos"),
+            (
+                "get_team_members",
+                ("org-name", "team-slug"),
+                "/orgs/org-name/teams/team-slug/members",
+            ),
+            ("get_authenticated_user_repos", (), "/user/repos"),
+            ("get_org_members", ("dummy_org",), "/orgs/dummy_org/members"),
+            ("get_org_admins", ("dummy_org",), "/orgs/dummy_org/members?role=admin"),
+            (
+                "get_repo_collaborators",
+                ("dummy_org", "repo"),
+                "/repos/dummy_org/repo/collaborators",
+            ),
+        ]
+        for method, args, url_suffix in cases:
+            with self.subTest(method=method, args=args):
+                self.github.get_paginated_response = Mock(return_value=[])
+                getattr(self.github, method)(*args)
+                self.github.get_paginated_response.assert_called_once_with(
+                    self.github.base_url + url_suffix
+                )
 
     def test_get_org(self):
-        fake_org_name = Mock()
+        fake_org_name = "fake-org"
         self.github.get_org(fake_org_name)
         self.github.get.assert_called_once_with(
             self.github.base_url + f"/orgs/{fake_org_name}",
         )
 
-    def test_get_orgs(self):
-        self.github.get_paginated_response = Mock()
-        self.github.get_organizations()
-        self.github.get_paginated_response.assert_called_once_with(
-            self.github.base_url + "/organizations",
-        )
-
-    def test_get_teams(self):
-        self.github.get_paginated_response = Mock()
-        self.github.get_teams("team")
-        self.github.get_paginated_response.assert_called_once_with(
-            self.github.base_url + "/orgs/team/teams",
-        )
-
-    def test_get_team_repos(self):
-        self.github.get_paginated_response = Mock()
-        self.github.get_team_repos("org-id", "team-id")
-        self.github.get_paginated_response.assert_called_once_with(
-            self.github.base_url + "/organizations/org-id/team/team-id/repos",
-        )
-
-    def test_get_team_members(self):
-        self.github.get_paginated_response = Mock()
-        self.github.get_team_members("org-name", "team-slug")
-        self.github.get_paginated_response.assert_called_once_with(
-            self.github.base_url + "/orgs/org-name/teams/team-slug/members",
-        )
-
-    def test_get_orgs_since(self):
-        self.github.get_paginated_response = Mock()
-        self.github.get_organizations(1)
-        self.github.get_paginated_response.assert_called_once_with(
-            self.github.base_url + "/organizations?since=1",
-        )
-
     def test_create_impersonation_token(self):
+        self._mock_writes()
         username = "fake user"
         scopes = ["fake scope"]
         self.github.create_impersonation_token("fake user", scopes)
@@ -333,16 +739,28 @@ class GitHubInstanceTestCase(TestCase):
         )
 
     def test_delete_impersonation_token(self):
+        self._mock_writes()
         username = "fake user"
+        self.github._impersonation_tokens[username] = "token"
         self.github.delete_impersonation_token("fake user")
         self.github.delete.assert_called_once_with(
             self.github.base_url + "/admin/users/{}/authorizations".format(username),
         )
+        self.assertNotIn(username, self.github._impersonation_tokens)
+
+    def test_create_impersonation_token_cached(self):
+        self.github.create_impersonation_token = Mock(
+            return_value=Mock(json=lambda: {"token": "token"})
+        )
+        self.assertEqual(self.github._create_impersonation_token("user"), "token")
+        self.assertEqual(self.github._create_impersonation_token("user"), "token")
+        self.github.create_impersonation_token.assert_called_once_with(
+            "user", GitHubInstance.ALL_SCOPES
+        )
 
-    @patch("ghe_policy_check.common.github_api.github_instance.get")
-    def test_get_impersonation_token(self, m_get):
+    def test_get_impersonation_token(self):
         m_token = "token"
-        m_get.return_value = Mock(raise_for_status=Mock())
+        m_get = self.github._session.get = Mock(return_value=Mock(raise_for_status=Mock()))
         self.github.create_impersonation_token = Mock(
             return_value=Mock(json=lambda: {"token": m_token})
         )
@@ -356,9 +774,9 @@ class GitHubInstanceTestCase(TestCase):
             "user", GitHubInstance.ALL_SCOPES
         )
 
-    @patch("ghe_policy_check.common.github_api.github_instance.get")
-    def test_get_impersonation_token_error(self, m_get):
+    def test_get_impersonation_token_error(self):
         m_token = "token"
+        m_get = self.github._session.get = Mock()
         m_get.return_value = Mock(
             raise_for_status=Mock(
                 side_effect=HTTPError(
@@ -391,81 +809,134 @@ class GitHubInstanceTestCase(TestCase):
             self.github.get_impersonation_token("user")
 
     def test_impersonate_user(self):
-        self.github.get_impersonation_token = Mock(return_value="fake token")
+        self.github._create_impersonation_token = Mock(return_value="fake token")
+        self.github._validate_token = Mock()
         username = "fake user"
 
         with self.github.impersonate_user(username) as impersonated_gh:
-            self.github.get_impersonation_token.assert_called_once_with(username)
+            self.github._create_impersonation_token.assert_called_once_with(username)
+            self.github._validate_token.assert_not_called()
             self.assertIsInstance(impersonated_gh, GitHubInstance)
             self.assertEqual(impersonated_gh.tokens, ["fake token"])
             self.assertEqual(impersonated_gh.impersonating, username)
 
-    def test_impersonate_user_suspened_error(self):
-        self.github.get_impersonation_token = Mock(
-            side_effect=[GithubAccountSuspendedException, "fake token"]
-        )
-        username = "fake user"
+    @patch("ghe_policy_check.common.github_api.github_instance.GitHubInstance.close")
+    def test_impersonate_user_closes_session(self, m_close):
+        self.github._create_impersonation_token = Mock(return_value="fake token")
+        self.github._validate_token = Mock()
 
-        with self.github.impersonate_user(username) as impersonated_gh:
-            self.github.get_impersonation_token.assert_has_calls(2 * [call(username)])
-            self.assertIsInstance(impersonated_gh, GitHubInstance)
-            self.assertEqual(impersonated_gh.tokens, ["fake token"])
-            self.assertEqual(impersonated_gh.impersonating, username)
+        with self.github.impersonate_user("fake user"):
+            m_close.assert_not_called()
+        m_close.assert_called_once()
 
-    def test_raise_github_exception_repo_blocked(self):
-        mock_response = Mock(
-            raise_for_status=Mock(side_effect=HTTPError),
-            json=lambda: {"message": "Repository access blocked"},
-        )
+    def test_impersonate_user_shares_session(self):
+        self.github._create_impersonation_token = Mock(return_value="fake token")
+        self.github._session.close = Mock()
 
-        mock_exception = Mock(response=mock_response)
-        with self.assertRaises(GithubRepositoryBlockedException):
-            self.github.raise_error(mock_exception)
+        with self.github.impersonate_user("fake user") as impersonated_gh:
+            self.assertIs(impersonated_gh._session, self.github._session)
+            self.assertEqual(impersonated_gh.base_url, self.github.base_url)
+        self.github._session.close.assert_not_called()
 
-    def test_raise_github_exception_suspended(self):
-        mock_response = Mock(
-            raise_for_status=Mock(side_effect=HTTPError),
-            json=lambda: {"message": "Sorry. Your account was suspended."},
+    def test_impersonate_user_suspened_error(self):
+        self._mock_writes()
+        self.github._create_impersonation_token = Mock(return_value="fake token")
+        username = "fake user"
+        suspended_url = self.github.base_url + f"/users/{username}/suspended"
+        response = Mock(headers={}, status_code=codes.ok)
+        suspended_response = Mock(
+            headers={},
+            status_code=codes.forbidden,
+            raise_for_status=Mock(
+                side_effect=HTTPError(
+                    response=Mock(
+                        status_code=codes.forbidden,
+                        json=lambda: {"message": "Sorry. Your account was suspended."},
+                    )
+                )
+            ),
         )
 
-        mock_exception = Mock(response=mock_response)
-        with self.assertRaises(GithubAccountSuspendedException):
-            self.github.raise_error(mock_exception)
+        with self.github.impersonate_user(username) as impersonated_gh:
+            impersonated_gh._session.request = Mock(side_effect=[suspended_response, response])
+            self.assertEqual(impersonated_gh.request("GET", "test.url.com"), response)
+            self.github.put.assert_not_called()
+            # Unsuspended once, resuspended after leaving the context manager
+            self.github.delete.assert_called_once_with(
+                suspended_url,
+                json={"reason": "Temporary unsuspension for impersonation"},
+            )
+        self.github.put.assert_called_once_with(
+            suspended_url,
+            json={"reason": "Resuspending after temporary suspension."},
+        )
 
-    def test_raise_github_exception_client(self):
-        mock_response = Mock(
-            json=lambda: {"message": "doesn't matter"},
-            status_code=422,
+    def test_impersonate_user_revoked_token(self):
+        username = "fake user"
+        self.github._impersonation_tokens[username] = "revoked token"
+        self.github.create_impersonation_token = Mock(
+            return_value=Mock(json=lambda: {"token": "new token"})
+        )
+        self.github._validate_token = Mock()
+        response = Mock(headers={}, status_code=codes.ok)
+        bad_credentials_response = Mock(
+            headers={},
+            status_code=codes.unauthorized,
+            raise_for_status=Mock(
+                side_effect=HTTPError(
+                    response=SimpleNamespace(
+                        status_code=codes.unauthorized,
+                        json=lambda: {"message": "Bad credentials"},
+                    )
+                )
+            ),
         )
-        mock_exception = Mock(response=mock_response)
-        with self.assertRaises(GithubClientException):
-            self.github.raise_error(mock_exception)
 
-    def test_raise_exception_no_matching_exception(self):
-        mock_exception = HTTPError
-        mock_response = Mock(
-            json=lambda: {"message": "doesn't matter"},
-            status_code=500,
+        with self.github.impersonate_user(username) as impersonated_gh:
+            impersonated_gh._session.request = Mock(
+                side_effect=[bad_credentials_response, response]
+            )
+            self.assertEqual(impersonated_gh.request("GET", "test.url.com"), response)
+            self.assertEqual(impersonated_gh.tokens, ["new token"])
+        # The revoked token is replaced in the cache of the impersonating instance
+        self.assertEqual(self.github._impersonation_tokens[username], "new token")
+        self.github.create_impersonation_token.assert_called_once_with(
+            username, GitHubInstance.ALL_SCOPES
+        )
+
+    def test_request_account_suspended_not_impersonating(self):
+        self.github._session.request = Mock(
+            return_value=Mock(
+                headers={},
+                status_code=codes.forbidden,
+                raise_for_status=Mock(
+                    side_effect=HTTPError(
+                        response=Mock(
+                            status_code=codes.forbidden,
+                            json=lambda: {"message": "Sorry. Your account was suspended."},
+                        )
+                    )
+                ),
+            )
         )
-        with self.assertRaises(mock_exception):
-            self.github.raise_error(mock_exception(response=mock_response))
+        with self.assertRaises(GithubAccountSuspendedException):
+            self.github.request("GET", "test.url.com")
+
+    def test_raise_exception_no_message(self):
+        mock_response = Mock(json=lambda: {}, status_code=502)
+        with self.assertRaises(HTTPError):
+            self.github.raise_error(HTTPError(response=mock_response))
 
     def test_set_organization_memberships(self):
-        fake_org_name = Mock()
-        fake_username = Mock()
+        self._mock_writes()
+        fake_org_name = "fake-org"
+        fake_username = "fake-user"
         self.github.set_organization_membership(fake_org_name, fake_username)
         self.github.put.assert_called_once_with(
             self.github.base_url + f"/orgs/{fake_org_name}/memberships/{fake_username}",
             json={"role": "admin"},
         )
 
-    def test_get_authenticated_user_repos(self):
-        self.github.get_paginated_response = Mock(return_value=[])
-        self.github.get_authenticated_user_repos()
-        self.github.get_paginated_response.assert_called_once_with(
-            self.github.base_url + "/user/repos"
-        )
-
     def test_suspend_user(self):
         self.github.put = Mock(return_value=[])
         self.github.suspend_user("test_user", "test_reason")
@@ -479,24 +950,3 @@ class GitHubInstanceTestCase(TestCase):
         self.github.delete.assert_called_once_with(
             self.github.base_url + "/users/test_user/suspended", json={"reason": "test_reason"}
         )
-
-    def test_get_org_members(self):
-        self.github.get_paginated_response = Mock(return_value=[])
-        self.github.get_org_members("dummy_org")
-        self.github.get_paginated_response.assert_called_once_with(
-            self.github.base_url + "/orgs/dummy_org/members"
-        )
-
-    def test_get_org_admins(self):
-        self.github.get_paginated_response = Mock(return_value=[])
-        self.github.get_org_admins("dummy_org")
-        self.github.get_paginated_response.assert_called_once_with(
-            self.github.base_url + "/orgs/dummy_org/members?role=admin"
-        )
-
-    def test_get_repo_collaborators(self):
-        self.github.get_paginated_response = Mock(return_value=[])
-        self.github.get_org_admins("dummy_org")
-        self.github.get_paginated_response.assert_called_once_with(
-            self.github.base_url + "/orgs/dummy_org/members?role=admin"
-        )
@@ -9,22 +9,25 @@ from django.test import TestCase
 from django.utils import timezone
 
 from ghe_policy_check.configuration import GHEPolicyCheckConfiguration
-from ghe_policy_check.models import BasicOrg, BasicRepo, BasicTeam, BasicUser
+from ghe_policy_check.models import BasicOrg, BasicRepo, BasicTeam, BasicUser, clear_github_id_cache
+
+# The timestamp returned by the patched timezone.now()
+NOW = timezone.now()
 
 
 class ModelsTestCase(TestCase):
     fixtures = ["test_data"]
 
-    def setUp(self):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
         GHEPolicyCheckConfiguration.configure_models(BasicRepo, BasicOrg, BasicUser, BasicTeam)
 
 
 class ReposTestCase(ModelsTestCase):
-    fixtures = ["test_data"]
-
     @patch("ghe_policy_check.models.timezone")
     def test_set_classification(self, m_timezone):
-        m_timezone.now.return_value = timezone.now()
+        m_timezone.now.return_value = NOW
         repo = GHEPolicyCheckConfiguration.Repo.objects.get(pk=1)
         repo.set_classification(GHEPolicyCheckConfiguration.Repo.Classification.LOW)
         self.assertEqual(repo.classification, GHEPolicyCheckConfiguration.Repo.Classification.LOW)
@@ -41,17 +44,34 @@ class ReposTestCase(ModelsTestCase):
 
     @patch("ghe_policy_check.models.timezone")
     def test_set_classification_none(self, m_timezone):
-        m_timezone.now.return_value = timezone.now()
+        m_timezone.now.return_value = NOW
         repo = GHEPolicyCheckConfiguration.Repo.objects.get(pk=1)
         repo.set_classification(None)
         self.assertEqual(repo.classification, None)
         self.assertEqual(repo.classification_modified, m_timezone.now.return_value)
 
+    def test_sync_collaborators(self):
+        repo = GHEPolicyCheckConfiguration.Repo.objects.get(pk=1)
+        users = list(GHEPolicyCheckConfiguration.User.objects.all())
+        repo.sync_collaborators(users)
+        self.assertCountEqual(repo.collaborators.all(), users)
+
+        repo.sync_collaborators(users[:1])
+        self.assertCountEqual(repo.collaborators.all(), users[:1])
+
+    def test_sync_collaborators_unchanged(self):
+        repo = GHEPolicyCheckConfiguration.Repo.objects.get(pk=1)
+        users = list(GHEPolicyCheckConfiguration.User.objects.all())
+        repo.sync_collaborators(users)
+
+        with self.assertNumQueries(1):
+            repo.sync_collaborators(users)
+
 
 class UserTestCase(ModelsTestCase):
     def setUp(self):
         self.mock_new_gh_user = {
-            "id": "2",
+            "id": 2,
             "login": "test",
         }
         self.mock_existing_gh_user = {
@@ -86,24 +106,42 @@ class UserTestCase(ModelsTestCase):
         self.assertEqual(user.username, self.mock_new_gh_user["login"])
         self.assertEqual(user.github_id, self.mock_new_gh_user["id"])
 
-    def test_from_github_user_integrity_error(self):
+    def test_from_github_user_created_concurrently(self):
         fake_user = Mock()
-        objs = GHEPolicyCheckConfiguration.User.objects
-        GHEPolicyCheckConfiguration.User.objects = Mock(
+        m_objects = Mock(
             get=Mock(side_effect=[GHEPolicyCheckConfiguration.User.DoesNotExist, fake_user]),
-            update_or_create=Mock(side_effect=IntegrityError),
         )
-        user = GHEPolicyCheckConfiguration.User.from_github_user(self.mock_new_gh_user)
+        with patch.object(GHEPolicyCheckConfiguration.User, "objects", m_objects):
+            user = GHEPolicyCheckConfiguration.User.from_github_user(self.mock_new_gh_user)
         self.assertEqual(user, fake_user)
-        GHEPolicyCheckConfiguration.User.objects.update_or_create.assert_called_once()
-        GHEPolicyCheckConfiguration.User.objects.get.assert_has_calls(
+        m_objects.bulk_create.assert_called_once()
+        self.assertTrue(m_objects.bulk_create.call_args[1]["ignore_conflicts"])
+        m_objects.get.assert_has_calls(
             [
                 call(github_id=self.mock_new_gh_user["id"]),
                 call(github_id=self.mock_new_gh_user["id"]),
             ]
         )
 
-        GHEPolicyCheckConfiguration.User.objects = objs
+    @patch("ghe_policy_check.models.transaction.on_commit", lambda func: func())
+    def test_from_github_user_cached(self):
+        self.addCleanup(clear_github_id_cache)
+        user = GHEPolicyCheckConfiguration.User.from_github_user(self.mock_existing_gh_user)
+
+        with self.assertNumQueries(0):
+            cached_user = GHEPolicyCheckConfiguration.User.from_github_user(
+                self.mock_existing_gh_user
+            )
+        self.assertEqual(cached_user, user)
+        self.assertEqual(cached_user.username, user.username)
+
+        user.username = "renamed user"
+        user.save()
+        with self.assertNumQueries(1):
+            cached_user = GHEPolicyCheckConfiguration.User.from_github_user(
+                self.mock_existing_gh_user
+            )
+        self.assertEqual(cached_user.username, "renamed user")
 
 
 class OrgTestCase(ModelsTestCase):
@@ -140,22 +178,19 @@ class OrgTestCase(ModelsTestCase):
 
     def test_from_github_org_integrity_error(self):
         fake_org = Mock()
-        objs = GHEPolicyCheckConfiguration.Org.objects
-        GHEPolicyCheckConfiguration.Org.objects = Mock(
+        owner = GHEPolicyCheckConfiguration.User.objects.get(pk=1)
+        m_objects = Mock(
             get=Mock(side_effect=[GHEPolicyCheckConfiguration.Org.DoesNotExist, fake_org]),
             create=Mock(side_effect=IntegrityError),
         )
-        org = GHEPolicyCheckConfiguration.Org.from_github_org(
-            self.mock_new_gh_org, GHEPolicyCheckConfiguration.User.objects.get(pk=1)
-        )
+        with patch.object(GHEPolicyCheckConfiguration.Org, "objects", m_objects):
+            org = GHEPolicyCheckConfiguration.Org.from_github_org(self.mock_new_gh_org, owner)
         self.assertEqual(org, fake_org)
-        GHEPolicyCheckConfiguration.Org.objects.create.assert_called_once()
-        GHEPolicyCheckConfiguration.Org.objects.get.assert_has_calls(
+        m_objects.create.assert_called_once()
+        m_objects.get.assert_has_calls(
             [call(github_id=self.mock_new_gh_org["id"]), call(github_id=self.mock_new_gh_org["id"])]
         )
 
-        GHEPolicyCheckConfiguration.Org.objects = objs
-
 
 class TeamTestCase(ModelsTestCase):
     def setUp(self):
@@ -4,13 +4,21 @@
 # pylint: disable=no-self-use
 import json
 import os
+from contextlib import nullcontext
+from types import SimpleNamespace
 from unittest.mock import Mock, patch
 
 from django.conf import settings
+from django.core.cache import cache
 from django.test import TestCase
 from django.utils import timezone
+from requests import ConnectionError as RequestsConnectionError
+from requests import HTTPError
 
-from ghe_policy_check.common.github_api.github_instance import GithubNotFoundException
+from ghe_policy_check.common.github_api.github_instance import (
+    GithubClientException,
+    GithubNotFoundException,
+)
 from ghe_policy_check.common.github_api.types import GitHubRepo
 from ghe_policy_check.configuration import GHEPolicyCheckConfiguration
 from ghe_policy_check.repo_polling import get_and_update_repo, get_polling_repos, remind_repo
@@ -20,11 +28,30 @@ from ghe_policy_check.utils import get_classification
 class RepoPollingTestCase(TestCase):
     fixtures = ["test_data"]
 
-    def setUp(self):
-        self.exit = lambda a, b, c, d: None
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # The payloads are only read, so they are parsed once for the class
         repo_path = os.path.join(os.path.dirname(__file__), "mock_payloads", "repos.json")
         with open(repo_path) as repo_file:
-            self.repos = json.load(repo_file)
+            cls.repos = json.load(repo_file)
+
+    def setUp(self):
+        cache.clear()
+        self.mock_impersonated = Mock()
+        self.mock_instance = Mock()
+        self.mock_instance.impersonate_user.return_value = nullcontext(self.mock_impersonated)
+        patcher = patch.object(
+            GHEPolicyCheckConfiguration, "GitHubInstance", Mock(return_value=self.mock_instance)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _get_local_repo(self, github_id):
+        # Loaded the way get_polling_repos loads the repos it hands to get_and_update_repo
+        return GHEPolicyCheckConfiguration.Repo.objects.select_related(
+            "owner", "org", "org__owner"
+        ).get(github_id=github_id)
 
     def test_remind_repo(self):
         repo = GHEPolicyCheckConfiguration.Repo.objects.create(
@@ -36,29 +63,36 @@ class RepoPollingTestCase(TestCase):
         )
         m_github_repo = GitHubRepo(owner={"login": "testuser"}, name="testrepo")
 
-        mock_instance = Mock()
-        mock_impersonated = Mock()
+        remind_repo(repo, m_github_repo)
+        self.mock_impersonated.add_repository_topics.assert_called_once_with(
+            m_github_repo["owner"]["login"],
+            m_github_repo["name"],
+            [settings.NOT_CLASSIFIED_TOPIC],
+            None,
+        )
 
-        mock_instance.impersonate_user = Mock(
-            return_value=Mock(__enter__=lambda _: mock_impersonated, __exit__=self.exit),
+    def test_remind_repo_topic_already_set(self):
+        repo = GHEPolicyCheckConfiguration.Repo.objects.create(
+            repo_name="test",
+            github_id=1000,
+            visibility=GHEPolicyCheckConfiguration.Repo.Visibility.PUBLIC,
+            size=1,
+            owner=GHEPolicyCheckConfiguration.User.objects.get(pk=1),
         )
-        GHEPolicyCheckConfiguration.GitHubInstance = Mock(return_value=mock_instance)
-        remind_repo(repo, m_github_repo)
-        mock_impersonated.add_repository_topics.assert_called_once_with(
-            m_github_repo["owner"]["login"], m_github_repo["name"], [settings.NOT_CLASSIFIED_TOPIC]
+        m_github_repo = GitHubRepo(
+            owner={"login": "testuser"}, name="testrepo", topics=[settings.NOT_CLASSIFIED_TOPIC]
         )
 
+        remind_repo(repo, m_github_repo)
+        self.mock_instance.impersonate_user.assert_not_called()
+
     def test_get_and_update_repo(self):
         github_repo = self.repos[0]
-        local_repo = GHEPolicyCheckConfiguration.Repo.objects.get(github_id=github_repo["id"])
-        mock_instance = Mock()
-        mock_impersonated = Mock()
-        mock_impersonated.get_repo_by_id.return_value = Mock(json=lambda: github_repo)
-
-        mock_instance.impersonate_user = Mock(
-            return_value=Mock(__enter__=lambda _: mock_impersonated, __exit__=self.exit),
+        local_repo = self._get_local_repo(github_repo["id"])
+        self.mock_impersonated.get_repo_by_id.return_value = SimpleNamespace(
+            json=lambda: github_repo
         )
-        GHEPolicyCheckConfiguration.GitHubInstance = Mock(return_value=mock_instance)
+
         now = timezone.now()
         get_and_update_repo(local_repo, now)
 
@@ -70,18 +104,26 @@ class RepoPollingTestCase(TestCase):
         self.assertEqual(local_repo.disabled, github_repo["disabled"])
         self.assertEqual(local_repo.html_url, github_repo["html_url"])
 
+    def test_get_and_update_repo_error_saves_polling_check(self):
+        github_repo = self.repos[0]
+        for exception in [GithubClientException, HTTPError, RequestsConnectionError, ValueError]:
+            with self.subTest(exception=exception):
+                local_repo = self._get_local_repo(github_repo["id"])
+                self.mock_impersonated.get_repo_by_id.side_effect = exception
+
+                now = timezone.now()
+                with self.assertRaises(exception):
+                    get_and_update_repo(local_repo, now)
+
+                local_repo.refresh_from_db()
+                self.assertEqual(local_repo.last_polling_check, now)
+
     @patch("ghe_policy_check.repo_polling.get_org_owner")
     def test_get_and_update_repo_delete_org(self, m_get_org_owner):
         github_repo = self.repos[0]
-        local_repo = GHEPolicyCheckConfiguration.Repo.objects.get(github_id=github_repo["id"])
-        mock_instance = Mock()
-        mock_impersonated = Mock()
-        mock_impersonated.get_repo_by_id.side_effect = GithubNotFoundException
+        local_repo = self._get_local_repo(github_repo["id"])
+        self.mock_impersonated.get_repo_by_id.side_effect = GithubNotFoundException
 
-        mock_instance.impersonate_user = Mock(
-            return_value=Mock(__enter__=lambda _: mock_impersonated, __exit__=self.exit),
-        )
-        GHEPolicyCheckConfiguration.GitHubInstance = Mock(return_value=mock_instance)
         m_get_org_owner.return_value = GHEPolicyCheckConfiguration.User.objects.get(github_id=1)
         now = timezone.now()
         self.assertEqual(get_and_update_repo(local_repo, now), None)
@@ -91,15 +133,9 @@ class RepoPollingTestCase(TestCase):
 
     def test_get_and_update_repo_delete_user(self):
         github_repo = self.repos[2]
-        local_repo = GHEPolicyCheckConfiguration.Repo.objects.get(github_id=github_repo["id"])
-        mock_instance = Mock()
-        mock_impersonated = Mock()
-        mock_impersonated.get_repo_by_id.side_effect = GithubNotFoundException
+        local_repo = self._get_local_repo(github_repo["id"])
+        self.mock_impersonated.get_repo_by_id.side_effect = GithubNotFoundException
 
-        mock_instance.impersonate_user = Mock(
-            return_value=Mock(__enter__=lambda _: mock_impersonated, __exit__=self.exit),
-        )
-        GHEPolicyCheckConfiguration.GitHubInstance = Mock(return_value=mock_instance)
         now = timezone.now()
 
         self.assertEqual(get_and_update_repo(local_repo, now), None)
@@ -3,31 +3,37 @@
 
 import json
 import os
-from unittest.mock import Mock, call
+from unittest.mock import Mock, patch
 
+from django.core.cache import cache
 from django.test import TestCase
 
-from ghe_policy_check.common.github_api.github_instance import GithubNotFoundException
 from ghe_policy_check.configuration import GHEPolicyCheckConfiguration
+from ghe_policy_check.models import clear_github_id_cache
 from ghe_policy_check.sync_users import run_sync_users
 
 
 class SyncUsersTestCase(TestCase):
     fixtures = ["test_data_with_suspended_user"]
 
-    def setUp(self):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
         user_path = os.path.join(os.path.dirname(__file__), "mock_payloads", "users.json")
-        with open(user_path) as repo_file:
-            self.users = json.load(repo_file)
+        with open(user_path) as user_file:
+            cls.users = json.load(user_file)
+
+    def setUp(self):
+        cache.clear()
 
-    def test_sync_users(self):
+    @patch.object(GHEPolicyCheckConfiguration, "GitHubInstance")
+    def test_sync_users(self, m_github_instance):
         mock_instance = Mock()
-        # Match order of last_synced field
-        mock_instance.get_user.side_effect = [
-            Mock(json=lambda: self.users[2]),
-            Mock(json=lambda: self.users[1]),
-        ]
-        GHEPolicyCheckConfiguration.GitHubInstance = Mock(return_value=mock_instance)
+        mock_instance.get_users_batch.return_value = {
+            "Snowtocat": self.users[2],
+            "testowner": self.users[1],
+        }
+        m_github_instance.return_value = mock_instance
 
         # Create mismatch in suspended status
         user = GHEPolicyCheckConfiguration.User.objects.get(username="Snowtocat")
@@ -38,13 +44,37 @@ class SyncUsersTestCase(TestCase):
         user = GHEPolicyCheckConfiguration.User.objects.get(username="Snowtocat")
         self.assertIsNotNone(user.suspended_at)
 
-    def test_sync_users_not_found(self):
+    @patch.object(GHEPolicyCheckConfiguration, "GitHubInstance")
+    def test_sync_users_not_found(self, m_github_instance):
         mock_instance = Mock()
 
-        mock_instance.get_user.side_effect = [
-            GithubNotFoundException(),
-            Mock(json=lambda: self.users[1]),
-        ]
-        GHEPolicyCheckConfiguration.GitHubInstance = Mock(return_value=mock_instance)
+        mock_instance.get_users_batch.return_value = {
+            "Snowtocat": None,
+            "testowner": self.users[1],
+        }
+        m_github_instance.return_value = mock_instance
+        run_sync_users()
+        # Match order of last_synced field
+        mock_instance.get_users_batch.assert_called_once_with(["Snowtocat", "testowner"])
+        user = GHEPolicyCheckConfiguration.User.objects.get(username="Snowtocat")
+        self.assertIsNone(user.last_synced)
+
+    @patch("ghe_policy_check.models.transaction.on_commit", lambda func: func())
+    @patch.object(GHEPolicyCheckConfiguration, "GitHubInstance")
+    def test_sync_users_invalidates_cached_users(self, m_github_instance):
+        self.addCleanup(clear_github_id_cache)
+        user = GHEPolicyCheckConfiguration.User.objects.get(username="Snowtocat")
+        github_user = {"login": user.username, "id": user.github_id}
+        GHEPolicyCheckConfiguration.User.from_github_user(github_user)
+        m_github_instance.return_value.get_users_batch.return_value = {
+            "Snowtocat": self.users[2],
+            "testowner": self.users[1],
+        }
+
         run_sync_users()
-        mock_instance.get_user.assert_has_calls([call("Snowtocat"), call("testowner")])
+        synced_user = GHEPolicyCheckConfiguration.User.from_github_user(github_user)
+        self.assertIsNotNone(synced_user.last_synced)
+        self.assertEqual(
+            synced_user.last_synced,
+            GHEPolicyCheckConfiguration.User.objects.get(pk=user.pk).last_synced,
+        )
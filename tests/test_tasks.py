@@ -2,9 +2,10 @@
 # SPDX-License-Identifier: BSD-3-Clause
 
 # pylint: disable=no-self-use
-from unittest.mock import Mock, call, patch
+from contextlib import nullcontext
+from unittest.mock import ANY, Mock, call, patch
 
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.utils import timezone
 
 from ghe_policy_check.common.github_api.github_instance import GithubNotFoundException
@@ -19,24 +20,25 @@ from ghe_policy_check.tasks import (
     sync_repo_collaborators_task,
 )
 
+# The timestamp returned by the patched timezone.now()
+NOW = timezone.now()
+
 
 class TasksTestCase(TestCase):
     fixtures = ["test_data"]
 
     def setUp(self):
-        self.exit = lambda a, b, c, d: None
         self.m_time = "20210601212915584192"
 
-    def test_sync_repo_collaborators_task(self):
+    @patch.object(GHEPolicyCheckConfiguration, "GitHubInstance")
+    def test_sync_repo_collaborators_task(self, m_github_instance):
         mock_instance = Mock()
         mock_impersonated = Mock()
 
         mock_impersonated.get_repo_collaborators = Mock(return_value=[{"id": 1}])
 
-        mock_instance.impersonate_user = Mock(
-            return_value=Mock(__enter__=lambda _: mock_impersonated, __exit__=self.exit),
-        )
-        GHEPolicyCheckConfiguration.GitHubInstance = Mock(return_value=mock_instance)
+        mock_instance.impersonate_user = Mock(return_value=nullcontext(mock_impersonated))
+        m_github_instance.return_value = mock_instance
 
         repo = GHEPolicyCheckConfiguration.Repo.objects.get(pk=1)
         sync_repo_collaborators_task(repo.github_id, self.m_time)
@@ -46,23 +48,13 @@ class TasksTestCase(TestCase):
 
         repo.refresh_from_db()
 
-        self.assertTrue(
-            GHEPolicyCheckConfiguration.User.objects.get(pk=1) in repo.collaborators.all()
-        )
-
-    @patch("ghe_policy_check.tasks.run_sync_repo_collaborators")
-    def test_sync_repo_collaborators_task_404(self, m_run_sync_repo_collaborators):
-        m_run_sync_repo_collaborators.side_effect = GithubNotFoundException
-
-        sync_repo_collaborators_task(0, self.m_time)
-        m_run_sync_repo_collaborators.assert_called_once_with(0, self.m_time)
+        self.assertTrue(repo.collaborators.filter(pk=1).exists())
 
-    @patch("ghe_policy_check.tasks.sync_repo_collaborators_task")
-    def test_sync_repo_collaborators(self, m_sync_repo_collaborators_task):
-        m_sync_repo_collaborators_task.delay = Mock()
+    @patch("ghe_policy_check.tasks.sync_repo_collaborators_task.delay")
+    def test_sync_repo_collaborators(self, m_delay):
         repo = GHEPolicyCheckConfiguration.Repo.objects.get(pk=1)
         sync_repo_collaborators(repo)
-        m_sync_repo_collaborators_task.delay.assert_called_once()
+        m_delay.assert_called_once()
 
     def test_delete_repository(self):
         delete_repository(1)
@@ -72,87 +64,116 @@ class TasksTestCase(TestCase):
     def test_add_membership(self):
         team_id = 1
         user_id = 1
+        start = timezone.now()
         add_membership(team_id, user_id)
-        local_team = GHEPolicyCheckConfiguration.Team.objects.get(github_id=team_id)
-
-        self.assertTrue(
-            GHEPolicyCheckConfiguration.User.objects.get(github_id=user_id)
-            in local_team.members.all()
-        )
-        self.assertEqual(4, local_team.repos.count())
+        local_team = GHEPolicyCheckConfiguration.Team.objects.prefetch_related(
+            "members", "repos__collaborators"
+        ).get(github_id=team_id)
+        user = GHEPolicyCheckConfiguration.User.objects.get(github_id=user_id)
+
+        self.assertTrue(user in local_team.members.all())
+        self.assertEqual(4, len(local_team.repos.all()))
+        self.assertGreaterEqual(local_team.modified, start)
         for repo in local_team.repos.all():
-            self.assertTrue(
-                GHEPolicyCheckConfiguration.User.objects.get(github_id=user_id)
-                in repo.collaborators.all()
-            )
+            self.assertTrue(user in repo.collaborators.all())
+            self.assertGreaterEqual(repo.modified, start)
 
     def test_add_membership_no_team(self):
         with self.assertRaises(GHEPolicyCheckConfiguration.Team.DoesNotExist):
             add_membership(9999, 1)
 
-    @patch("ghe_policy_check.tasks.sync_repo_collaborators")
-    def test_add_org_membership(self, m_sync_repo_collaborators):
+    @patch("ghe_policy_check.tasks.group")
+    @patch("ghe_policy_check.tasks.sync_repo_collaborators_task")
+    def test_add_org_membership(self, m_sync_repo_collaborators_task, m_group):
         org_id = 1
         user_id = 1
         org = GHEPolicyCheckConfiguration.Org.objects.get(github_id=org_id)
+        start = timezone.now()
 
         add_org_member(org_id, user_id)
 
-        self.assertTrue(
-            GHEPolicyCheckConfiguration.User.objects.get(github_id=user_id) in org.members.all()
-        )
+        self.assertTrue(org.members.filter(github_id=user_id).exists())
+        org.refresh_from_db()
+        self.assertGreaterEqual(org.modified, start)
 
-        for repo in org.repos.all():
-            m_sync_repo_collaborators.assert_has_calls([call(repo)])
+        signatures = list(m_group.call_args[0][0])
+        self.assertEqual(len(signatures), org.repos.filter(disabled=False).count())
+        m_sync_repo_collaborators_task.s.assert_has_calls(
+            [call(repo.github_id, ANY) for repo in org.repos.filter(disabled=False)],
+            any_order=True,
+        )
+        m_group.return_value.apply_async.assert_called_once_with()
 
     def test_add_org_member_no_team(self):
         with self.assertRaises(GHEPolicyCheckConfiguration.Org.DoesNotExist):
             add_org_member(9999, 1)
 
-    @patch("ghe_policy_check.tasks.timezone")
-    def test_repo_polling(self, m_timezone):
-        m_timezone.now.return_value = timezone.now()
-        m_repo_1 = Mock(repo_name="Repo 1", is_reminder_candidate=True)
-        m_repo_2 = Mock(repo_name="Repo 2", is_reminder_candidate=False)
-        m_repo_3 = Mock(repo_name="Repo 3", is_reminder_candidate=True)
-        GetPollingRepos.get_polling_repos = Mock(return_value=[m_repo_1, m_repo_2, m_repo_3])
-        m_github_repo = Mock()
-        GetAndUpdateRepo.get_and_update_repo = Mock(return_value=m_github_repo)
-        RemindRepo.remind_repo = Mock()
 
-        repo_polling()
+class NoDBTasksTestCase(SimpleTestCase):
+    """Task tests that only check calls on mocks and never touch the database"""
 
-        GetAndUpdateRepo.get_and_update_repo.assert_has_calls(
-            [
-                call(m_repo_1, m_timezone.now.return_value),
-                call(m_repo_2, m_timezone.now.return_value),
-                call(m_repo_3, m_timezone.now.return_value),
-            ]
-        )
-        RemindRepo.remind_repo.assert_has_calls(
-            [
-                call(m_repo_1, m_github_repo),
-                call(m_repo_3, m_github_repo),
-            ]
-        )
+    def setUp(self):
+        self.m_time = "20210601212915584192"
+
+    @patch("ghe_policy_check.tasks.run_sync_repo_collaborators")
+    def test_sync_repo_collaborators_task_404(self, m_run_sync_repo_collaborators):
+        m_run_sync_repo_collaborators.side_effect = GithubNotFoundException
+
+        sync_repo_collaborators_task(0, self.m_time)
+        m_run_sync_repo_collaborators.assert_called_once_with(0, self.m_time)
 
     @patch("ghe_policy_check.tasks.timezone")
-    def test_repo_polling_error(self, m_timezone):
-        m_timezone.now.return_value = timezone.now()
-        m_repo_1 = Mock(repo_name="Repo 1", is_reminder_candidate=True)
-        m_repo_2 = Mock(repo_name="Repo 2", is_reminder_candidate=False)
-        m_repo_3 = Mock(repo_name="Repo 3", is_reminder_candidate=True)
-        GetPollingRepos.get_polling_repos = Mock(return_value=[m_repo_1, m_repo_2, m_repo_3])
-        GetAndUpdateRepo.get_and_update_repo = Mock(return_value=None)
-        RemindRepo.remind_repo = Mock()
-
-        repo_polling()
-
-        GetAndUpdateRepo.get_and_update_repo.assert_has_calls(
-            [
-                call(m_repo_1, m_timezone.now.return_value),
-                call(m_repo_2, m_timezone.now.return_value),
-                call(m_repo_3, m_timezone.now.return_value),
-            ]
-        )
-        RemindRepo.remind_repo.assert_not_called()
+    def test_repo_polling(self, m_timezone):
+        m_timezone.now.return_value = NOW
+        m_repos = [
+            Mock(repo_name="Repo 1", is_reminder_candidate=True),
+            Mock(repo_name="Repo 2", is_reminder_candidate=False),
+            Mock(repo_name="Repo 3", is_reminder_candidate=True),
+        ]
+        m_github_repo = Mock()
+        cases = [
+            # get_and_update_repo return value, repos that are reminded
+            (m_github_repo, [m_repos[0], m_repos[2]]),
+            # The repo could not be polled
+            (None, []),
+        ]
+        for github_repo, reminded_repos in cases:
+            polling_patch = patch.object(GetPollingRepos, "get_polling_repos", return_value=m_repos)
+            update_patch = patch.object(
+                GetAndUpdateRepo, "get_and_update_repo", return_value=github_repo
+            )
+            remind_patch = patch.object(RemindRepo, "remind_repo")
+            with self.subTest(github_repo=github_repo), polling_patch:
+                with update_patch as m_get_and_update_repo, remind_patch as m_remind_repo:
+                    repo_polling()
+
+                    m_get_and_update_repo.assert_has_calls(
+                        [call(m_repo, m_timezone.now.return_value) for m_repo in m_repos],
+                        any_order=True,
+                    )
+                    self.assertEqual(m_get_and_update_repo.call_count, 3)
+                    m_remind_repo.assert_has_calls(
+                        [call(m_repo, github_repo) for m_repo in reminded_repos], any_order=True
+                    )
+                    self.assertEqual(m_remind_repo.call_count, len(reminded_repos))
+
+    @override_settings(POLLING_WORKERS=2)
+    @patch("ghe_policy_check.tasks.connection")
+    def test_repo_polling_worker_connections(self, m_connection):
+        m_repos = [Mock(repo_name=f"Repo {index}") for index in range(5)]
+
+        def get_and_update_repo(local_repo, _last_polling_check):
+            if local_repo is m_repos[0]:
+                raise GithubNotFoundException
+
+        with patch.object(GetPollingRepos, "get_polling_repos", return_value=m_repos):
+            with patch.object(
+                GetAndUpdateRepo, "get_and_update_repo", side_effect=get_and_update_repo
+            ) as m_get_and_update_repo:
+                with self.assertRaises(GithubNotFoundException):
+                    repo_polling()
+
+        # The repos after the failed one are still polled
+        self.assertEqual(m_get_and_update_repo.call_count, 5)
+        # Every worker closes its database connection once
+        self.assertEqual(m_connection.close.call_count, 2)
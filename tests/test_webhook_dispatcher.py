@@ -2,43 +2,84 @@
 # SPDX-License-Identifier: BSD-3-Clause
 
 import hmac
-from hashlib import sha1
+from hashlib import sha1, sha256
 from unittest import TestCase
+from unittest.mock import Mock, PropertyMock, patch
 
 from ghe_policy_check.common.github_api.webhook_dispatcher import (
     InvalidSignature,
     OperationNotSupportedException,
+    UnhandledActionException,
     WebhookDispatcher,
 )
 
+SECRET = "secret"
+BODY = b"body"
+SHA1_SIGNATURE = "sha1=" + hmac.new(SECRET.encode(), BODY, digestmod=sha1).hexdigest()
+SHA256_SIGNATURE = "sha256=" + hmac.new(SECRET.encode(), BODY, digestmod=sha256).hexdigest()
+WRONG_SHA1_SIGNATURE = (
+    "sha1=" + hmac.new(("wrong" + SECRET).encode(), BODY, digestmod=sha1).hexdigest()
+)
+
 
 class GitHubInstanceTestCase(TestCase):
-    def setUp(self):
-        self.secret = "secret"
-        self.dispatcher = WebhookDispatcher(self.secret)
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.dispatcher = WebhookDispatcher(SECRET)
 
     def test_secure_github_request(self):
-        body = b"body"
-
-        sha1_hash = hmac.new(self.secret.encode(), body, digestmod=sha1).hexdigest()
-        signature = f"sha1={sha1_hash}"
-        self.assertIsNone(self.dispatcher.secure_github_request(signature, body))
+        self.assertIsNone(self.dispatcher.secure_github_request(SHA1_SIGNATURE, BODY))
 
-    def test_secure_github_request_not_sha1(self):
-        body = b"body"
+    def test_secure_github_request_sha256(self):
+        self.assertIsNone(self.dispatcher.secure_github_request(SHA256_SIGNATURE, BODY))
 
-        signature = "sha256=abcd"
+    def test_secure_github_request_not_supported(self):
         with self.assertRaises(OperationNotSupportedException):
-            self.dispatcher.secure_github_request(signature, body)
+            self.dispatcher.secure_github_request("md5=abcd", BODY)
 
     def test_secure_github_request_invalid_signature(self):
-        body = b"body"
+        with self.assertRaises(InvalidSignature):
+            self.dispatcher.secure_github_request(WRONG_SHA1_SIGNATURE, BODY)
 
-        sha1_hash = hmac.new(("wrong" + self.secret).encode(), body, digestmod=sha1).hexdigest()
-        signature = f"sha1={sha1_hash}"
+    def test_secure_github_request_malformed_signature(self):
         with self.assertRaises(InvalidSignature):
-            self.dispatcher.secure_github_request(signature, body)
+            self.dispatcher.secure_github_request("sha1=not-hex", BODY)
 
     def test_secure_github_request_no_signature(self):
         with self.assertRaises(InvalidSignature):
             self.dispatcher.secure_github_request(None, b"")
+
+    @patch.object(WebhookDispatcher, "secure_github_request", Mock())
+    @patch.dict(WebhookDispatcher.registry, clear=True)
+    def test_register_lower_cases_event(self):
+        handler = Mock()
+        WebhookDispatcher.register("Repository")(handler)
+
+        request = Mock(data={"action": "created"})
+        self.assertEqual(
+            self.dispatcher.dispatch(request, "repository", "sha1=", b""),
+            handler.return_value,
+        )
+        handler.assert_called_once_with(request)
+
+    @patch.object(WebhookDispatcher, "secure_github_request", Mock())
+    @patch.dict(WebhookDispatcher.registry, clear=True)
+    def test_register_lower_cases_action(self):
+        handler = Mock()
+        WebhookDispatcher.register("Repository", "Created")(handler)
+
+        request = Mock(data={"action": "Created"})
+        self.dispatcher.dispatch(request, "repository", "sha1=", b"")
+        handler.assert_called_once_with(request)
+        with self.assertRaises(UnhandledActionException):
+            self.dispatcher.dispatch(Mock(data={"action": "deleted"}), "repository", "sha1=", b"")
+
+    @patch.dict(WebhookDispatcher.registry, clear=True)
+    def test_dispatch_invalid_signature_does_not_parse_payload(self):
+        WebhookDispatcher.register("repository", "created")(Mock())
+        request = Mock()
+        type(request).data = PropertyMock(side_effect=AssertionError("payload parsed"))
+
+        with self.assertRaises(InvalidSignature):
+            self.dispatcher.dispatch(request, "repository", "sha1=invalid", b"{}")